@@ -0,0 +1,46 @@
+# Memory used by tent items and limb views, measured with `tracemalloc`.
+# Run it from the root of the repository on two commits to compare them:
+#   PYTHONPATH=. python extra/slots_benchmark.py
+
+import tracemalloc
+import gc
+
+from milsim.types import Item, CartridgeBox, Body
+from milsim.items import BandageItem, TourniquetItem, SplintItem
+from milsim.weapon import R762Magazine
+from milsim.builtin import Bullet
+
+def measure(fun):
+    gc.collect()
+    tracemalloc.start()
+
+    retval = fun()
+
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return size, retval
+
+# Kept in a list, so that only the items themselves are measured and not the index of `Inventory`.
+def items(n = 1200):
+    retval = []
+
+    for k in range(n // 5):
+        retval.append(BandageItem())
+        retval.append(TourniquetItem())
+        retval.append(SplintItem())
+        retval.append(R762Magazine())
+        retval.append(CartridgeBox(Bullet, 50))
+
+    return retval
+
+def bodies(n = 32):
+    return [Body() for k in range(n)]
+
+if __name__ == "__main__":
+    Item.reset()
+
+    for name, fun in ("1200 tent items", items), ("32 standalone bodies", bodies):
+        size, _ = measure(fun)
+        print("{}: {} B".format(name, size))
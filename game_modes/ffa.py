@@ -14,6 +14,8 @@ from dataclasses import dataclass
 from itertools import islice
 from random import randint
 
+from milsim.maptools import Grid
+
 fst = lambda xs: xs[0]
 snd = lambda xs: xs[1]
 
@@ -31,6 +33,9 @@ WATER_SPAWNS = False
 
 HIDE_POS = (0, 0, 63)
 
+def is_spawn_column(M, w):
+    return WATER_SPAWNS or M.get_z(*w) != 63
+
 def show_score(item):
     idx, (name, score) = item
     return "%d) %s (%d kills, %d deaths)" % (idx, name, score.kills, score.deaths)
@@ -94,7 +99,19 @@ def apply_script(protocol, connection, config):
                     self.friendly_fire = self.old_friendly_fire
                     self.old_friendly_fire = None
 
-            return protocol.on_map_change(self, map)
+            retval = protocol.on_map_change(self, map)
+
+            # Built right away, so that it does not delay the first spawns.
+            if self.free_for_all:
+                self.get_ffa_spawn_index()
+
+            return retval
+
+        def get_ffa_spawn_index(self):
+            grid = Grid(*self.spawn_borders_x, *self.spawn_borders_y)
+            locate = lambda x, y, z: (grid.ordinal(x, y),) if (x, y) in grid else ()
+
+            return self.get_spawn_index('ffa', grid, is_spawn_column, locate)
 
         def on_base_spawn(self, x, y, z, base, entity_id):
             if self.free_for_all:
@@ -117,12 +134,15 @@ def apply_script(protocol, connection, config):
 
         def on_spawn_location(self, pos):
             if not self.score_hack and self.protocol.free_for_all:
-                while True:
+                M = self.protocol.map
+
+                if (w := self.protocol.get_ffa_spawn_index().sample()) is not None:
+                    x, y = w
+                else:
                     x = randint(*self.protocol.spawn_borders_x)
                     y = randint(*self.protocol.spawn_borders_y)
-                    z = self.protocol.map.get_z(x, y)
-                    if z != 63 or WATER_SPAWNS:
-                        break
+
+                z = M.get_z(x, y)
                 # Magic numbers taken from server.py spawn function
                 z -= 2.4
                 x += 0.5
@@ -6,10 +6,13 @@
 #include <Milsim/Fundamentals.hxx>
 
 #include <unordered_map>
+#include <unordered_set>
+#include <algorithm>
 #include <utility>
 #include <cstdint>
 #include <vector>
 #include <chrono>
+#include <array>
 #include <list>
 #include <map>
 
@@ -53,7 +56,10 @@ public:
 struct Player {
     bool c; Vector * p; Vector * f;
 
-    inline Player() : p(nullptr), f(nullptr) {}
+    // Floor position at the previous `Engine::sweep`, see `MilsimConnection.floor`.
+    bool tracked; Vector3i last;
+
+    inline Player() : p(nullptr), f(nullptr), tracked(false) {}
 
     inline bool valid() const { return p != nullptr; }
 
@@ -65,6 +71,10 @@ struct Player {
     inline Vector3d position()    const { return Vector3d(p); }
     inline Vector3d orientation() const { return Vector3d(f); }
 
+    inline Vector3i floor() const {
+        return Vector3i(std::floor(p->x), std::floor(p->y), std::floor(p->z) + (c ? 2 : 3));
+    }
+
     inline auto intersect(const Ray<double> & r) const {
         using namespace std;
 
@@ -90,6 +100,8 @@ struct Player {
     }
 };
 
+std::vector<Vector3i> cube(const Vector3i & v, int radius);
+
 enum class Terminal { flying, ricochet, penetration };
 
 using ObjectQueue    = std::list<Object>;
@@ -133,6 +145,39 @@ public:
     }
 };
 
+// Work done by `Engine::step`.
+struct Counters {
+    uint64_t voxels = 0, penetrations = 0, ricochets = 0, playerTests = 0, callbacks = 0;
+
+    double callbackTime = 0.0, physicsTime = 0.0; // μs
+
+    inline Counters & operator+=(const Counters & o) {
+        voxels += o.voxels; penetrations += o.penetrations; ricochets += o.ricochets;
+        playerTests += o.playerTests; callbacks += o.callbacks;
+
+        callbackTime += o.callbackTime; physicsTime += o.physicsTime;
+
+        return *this;
+    }
+};
+
+struct Stats {
+    // Upper bounds (μs) of the buckets of the step time histogram, the last bucket is unbounded.
+    static constexpr std::array<double, 10> bounds = { 10, 30, 100, 300, 1e+3, 3e+3, 1e+4, 3e+4, 1e+5, 3e+5 };
+
+    uint64_t steps = 0; std::array<uint64_t, bounds.size() + 1> histogram{};
+
+    // `last` is the last step, `total` is everything since the last `reset`.
+    Counters last, total;
+
+    inline void add(double T) {
+        steps++; total += last;
+        histogram[std::upper_bound(bounds.begin(), bounds.end(), T) - bounds.begin()]++;
+    }
+
+    inline void reset() { *this = Stats(); }
+};
+
 struct Engine {
 public:
     PyOwnedRef protocol;
@@ -142,7 +187,12 @@ public:
     ObjectQueue objects;
     std::vector<Player> players;
 
-    PyOwnedRef onTrace, onBlockHit, onPlayerHit, onDestroy;
+    // Voxels (as `get_pos`) that trigger `onPressure` when a player walks over them.
+    std::unordered_set<int> pressureVoxels;
+
+    PyOwnedRef onTrace, onBlockHit, onPlayerHit, onDestroy, onDestroyMany, onPressure;
+
+    Stats stats;
 
     // Independent variables.
     double   temperature; // °C
@@ -160,6 +210,22 @@ private:
 
     void next(double t1, const double t2, ObjectIterator &);
 
+    // Calls `f` from `Engine::step`, so that it is counted in `stats`.
+    template<typename... Ts> inline PyOwnedRef call(const PyOwnedRef & f, Ts... ts) {
+        using namespace std::chrono;
+
+        if (f == nullptr) return PyOwnedRef();
+
+        const auto T1 = steady_clock::now();
+        auto retval = f(ts...);
+        const auto T2 = steady_clock::now();
+
+        stats.last.callbacks++;
+        stats.last.callbackTime += duration<double, std::micro>(T2 - T1).count();
+
+        return retval;
+    }
+
 public:
     inline Engine(PyObject * o) : protocol(o), _lag(0.0), _peak(0.0)
     { srand(time(NULL)); players.reserve(32); }
@@ -193,9 +259,16 @@ public:
 
     void update();
     void clear();
+    void reset();
+
+    bool smash(int x, int y, int z, double ΔE);
+    void smash(int player_id, const std::vector<Vector3i> & cells, double ΔE);
+
+    std::vector<std::pair<int, double>> blast(const Vector3d & r, double inner, double outer);
 
     inline void trace(const uint64_t index, const Vector3d & r, const double value, bool origin)
     { onTrace(index, r.x, r.y, r.z, value, origin); }
 
     void step(const double t1, const double t2);
+    void sweep();
 };
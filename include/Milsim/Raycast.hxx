@@ -0,0 +1,166 @@
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <thread>
+#include <vector>
+#include <cmath>
+
+#include <vxl_c.h>
+
+namespace Raycast {
+    // Same as `FOG_DISTANCE` in world_c.cpp.
+    constexpr long fogDistance = 128;
+
+    inline long ftol(float f) { return std::floor(f + 0.5f); }
+
+    // Same as `isvoxelsolidwrap` in world_c.cpp, but without the `global_map`.
+    inline bool solid(MapData * M, long x, long y, long z) {
+        if (z < 0) return false;
+        if (z >= 64) return true;
+
+        return M->geometry[get_pos(x & 511, y & 511, z)];
+    }
+}
+
+// https://github.com/piqueserver/piqueserver/blob/master/pyspades/world_c.cpp
+// This is a reentrant version of `can_see` that does not touch the `global_map`,
+// so that `canSeeMany` can call it from multiple threads at once for the same map.
+inline bool canSee(MapData * M, float x0, float y0, float z0, float x1, float y1, float z1) {
+    using namespace Raycast;
+
+    long ax = ftol(x0 - .5f), ay = ftol(y0 - .5f), az = ftol(z0 - .5f);
+    long cx = ftol(x1 - .5f), cy = ftol(y1 - .5f), cz = ftol(z1 - .5f);
+
+    long dx = 0, dy = 0, dz = 0, cnt = 0;
+    float fx, fy, fz, gx, gy, gz;
+
+    if (cx < ax) {
+        dx = -1; fx = x0 - ax; gx = (x0 - x1) * 1024; cnt += ax - cx;
+    } else if (cx != ax) {
+        dx = +1; fx = ax + 1 - x0; gx = (x1 - x0) * 1024; cnt += cx - ax;
+    } else fx = gx = 0;
+
+    if (cy < ay) {
+        dy = -1; fy = y0 - ay; gy = (y0 - y1) * 1024; cnt += ay - cy;
+    } else if (cy != ay) {
+        dy = +1; fy = ay + 1 - y0; gy = (y1 - y0) * 1024; cnt += cy - ay;
+    } else fy = gy = 0;
+
+    if (cz < az) {
+        dz = -1; fz = z0 - az; gz = (z0 - z1) * 1024; cnt += az - cz;
+    } else if (cz != az) {
+        dz = +1; fz = az + 1 - z0; gz = (z1 - z0) * 1024; cnt += cz - az;
+    } else fz = gz = 0;
+
+    long px = ftol(fx * gz - fz * gx), ix = ftol(gx);
+    long py = ftol(fy * gz - fz * gy), iy = ftol(gy);
+    long pz = ftol(fy * gx - fx * gy), iz = ftol(gz);
+
+    if (cnt > fogDistance) cnt = fogDistance;
+
+    for (; cnt > 0; cnt--) {
+        if ((px | py) >= 0 && az != cz) {
+            az += dz; px -= ix; py -= iy;
+        } else if (pz >= 0 && ax != cx) {
+            ax += dx; px += iz; pz -= iy;
+        } else {
+            ay += dy; py += iz; pz += ix;
+        }
+
+        if (solid(M, ax, ay, az)) return false;
+    }
+
+    return true;
+}
+
+// Tests the visibility of (x, y, z) from each of `count` targets (3 floats each) and writes it to `mask`.
+// Targets farther than `radius` are culled before any ray is marched, the rest are split between threads.
+inline void canSeeMany(MapData * M, float x, float y, float z, const float * targets, size_t count, float radius, uint8_t * mask) {
+    // Spawning a thread costs more than marching a few rays.
+    constexpr size_t raysPerThread = 16;
+
+    auto R = radius * radius;
+
+    auto march = [=](size_t i₁, size_t i₂) {
+        for (size_t i = i₁; i < i₂; i++) {
+            auto r = targets + 3 * i;
+
+            float dx = r[0] - x, dy = r[1] - y, dz = r[2] - z;
+
+            // Rays that are too long are culled before marching.
+            mask[i] = dx * dx + dy * dy + dz * dz < R && canSee(M, r[0], r[1], r[2], x, y, z);
+        }
+    };
+
+    size_t N = std::min<size_t>(
+        std::max(1u, std::thread::hardware_concurrency()),
+        (count + raysPerThread - 1) / raysPerThread
+    );
+
+    if (N <= 1) { march(0, count); return; }
+
+    std::vector<std::thread> workers; workers.reserve(N - 1);
+
+    size_t chunk = (count + N - 1) / N;
+
+    for (size_t k = 1; k < N; k++)
+        workers.emplace_back(march, k * chunk, std::min(count, (k + 1) * chunk));
+
+    march(0, chunk);
+
+    for (auto & worker : workers) worker.join();
+}
+
+// https://github.com/piqueserver/piqueserver/blob/master/pyspades/world_c.cpp
+// Same as `cube_line`, but `f(x, y, z)` is called for every cell instead of filling an array.
+template<typename F> inline void cubeLine(long x1, long y1, long z1, long x2, long y2, long z2, F && f) {
+    using std::abs;
+
+    constexpr size_t cubeArrayLength = 64;
+    constexpr long   size            = 512;
+    constexpr long   far             = 0x3fffffff / size;
+
+    long x = x1, y = y1, z = z1;
+
+    long Dx = x2 - x1, Dy = y2 - y1, Dz = z2 - z1;
+    long sx = Dx < 0 ? -1 : 1, sy = Dy < 0 ? -1 : 1, sz = Dz < 0 ? -1 : 1;
+
+    long dx, dy, dz, dxi, dyi, dzi;
+
+    if (abs(Dx) >= abs(Dy) && abs(Dx) >= abs(Dz)) {
+        dxi = 1024; dx = 512;
+        dyi = !Dy ? far : abs(Dx * 1024 / Dy); dy = dyi / 2;
+        dzi = !Dz ? far : abs(Dx * 1024 / Dz); dz = dzi / 2;
+    } else if (abs(Dy) >= abs(Dz)) {
+        dyi = 1024; dy = 512;
+        dxi = !Dx ? far : abs(Dy * 1024 / Dx); dx = dxi / 2;
+        dzi = !Dz ? far : abs(Dy * 1024 / Dz); dz = dzi / 2;
+    } else {
+        dzi = 1024; dz = 512;
+        dxi = !Dx ? far : abs(Dz * 1024 / Dx); dx = dxi / 2;
+        dyi = !Dy ? far : abs(Dz * 1024 / Dy); dy = dyi / 2;
+    }
+
+    if (sx >= 0) dx = dxi - dx;
+    if (sy >= 0) dy = dyi - dy;
+    if (sz >= 0) dz = dzi - dz;
+
+    for (size_t count = 1;; count++) {
+        f(x, y, z);
+
+        if (count >= cubeArrayLength) return;
+        if (x == x2 && y == y2 && z == z2) return;
+
+        if (dz <= dx && dz <= dy) {
+            z += sz; if (z < 0 || z >= 64) return;
+            dz += dzi;
+        } else if (dx < dy) {
+            x += sx; if ((unsigned long) x >= size) return;
+            dx += dxi;
+        } else {
+            y += sy; if ((unsigned long) y >= size) return;
+            dy += dyi;
+        }
+    }
+}
@@ -1,5 +1,6 @@
 #pragma once
 
+#include <cstdint>
 #include <vector>
 
 #include <vxl_c.h>
@@ -11,6 +12,29 @@ int traverseNode(int x, int y, int z, MapData *, int destroy);
 void deleteQueueClear();
 int deleteQueuePop();
 
+// Same as `make_color` in pyspades/vxl.pyx with `a = 255`.
+inline int makeColor(int r, int g, int b) { return b | (g << 8) | (r << 16) | (128 << 24); }
+
+struct Brush {
+    int r, g, b, jitter; uint64_t seed;
+
+    // Every channel is shifted by a value in [−jitter, +jitter] that depends only on the seed and the position.
+    int color(int x, int y, int z) const;
+};
+
+void fillBox(MapData *, const Brush &, int x1, int y1, int z1, int x2, int y2, int z2);
+void hollowBox(MapData *, const Brush &, int x1, int y1, int z1, int x2, int y2, int z2);
+void clearBox(MapData *, int x1, int y1, int z1, int x2, int y2, int z2);
+void drawLine(MapData *, const Brush &, int x1, int y1, int z1, int x2, int y2, int z2);
+// Both buffers have `MAP_X * MAP_Y * MAP_Z` entries indexed by `get_pos`, the colour is 0 where there is none.
+void unpackMap(const MapData *, uint8_t * solid, uint32_t * colors);
+void packMap(MapData *, const uint8_t * solid, const uint32_t * colors);
+
+// Decodes a .vxl file, columns are split between threads by rows. Returns false if the data is malformed.
+bool loadMap(MapData *, const uint8_t * data, size_t size);
+
+void copyRegion(MapData * dest, const MapData * src, int x1, int y1, int z1, int x2, int y2, int z2, int x, int y, int z);
+
 inline void visit(std::vector<Vector3i> & out, int x, int y, int z, MapData * M) {
     if (x < 0 || 512 <= x || y < 0 || 512 <= y || z < 0 || 64 <= z)
         return;
@@ -70,9 +70,10 @@ def on_map_generation(dirname, seed):
     vxl = VxlData()
 
     water = rgen.hsvi(0.5, 0.7, hue = huef)
+    brick = rgen.hsvi(0.75, 0.75, hue = huef)
+    noise = rgen.getrandbits(64)
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, water)
+    vxl.fill_plane(63, water)
 
     for x, Δy in product(range(512), range(64)):
         z = height(x)
@@ -83,12 +84,11 @@ def on_map_generation(dirname, seed):
         vxl.set_column_fast(x, 256 - Δy, 0, z, 0, 0)
         vxl.set_column_fast(x, 256 + Δy, 0, z, 0, 0)
 
-        vxl.set_point(x, 256 - Δy, 63 - z, rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 - Δy, z,      rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 - Δy, 0,      rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 + Δy, 63 - z, rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 + Δy, z,      rgen.hsvi(hue = huef))
-        vxl.set_point(x, 256 + Δy, 0,      rgen.hsvi(hue = huef))
+    for x in range(512):
+        z = height(x)
+
+        for Z in 63 - z, z, 0:
+            vxl.fill_box(x, 256 - 63, Z, x, 256 + 63, Z, brick, jitter = 32, seed = noise)
 
     for y in range(256 - 64, 256 + 65):
         x1, x2 = wall1(y), wall2(y)
@@ -97,9 +97,8 @@ def on_map_generation(dirname, seed):
             vxl.set_column_fast(x, y, 1, 63, 0, 0)
 
         if x1 < x2:
-            for z, Δx in product(range(64), range(8)):
-                vxl.set_point(x1 + Δx, y, z, rgen.hsvi(hue = huef))
-                vxl.set_point(x2 - Δx, y, z, rgen.hsvi(hue = huef))
+            vxl.fill_box(x1, y, 0, x1 + 7, y, 63, brick, jitter = 32, seed = noise)
+            vxl.fill_box(x2 - 7, y, 0, x2, y, 63, brick, jitter = 32, seed = noise)
 
     return vxl
 
@@ -1,5 +1,3 @@
-from itertools import product
-
 from pyspades.common import make_color
 
 from milsim.types import StaticWeather
@@ -21,21 +19,14 @@ fog      = rgen.hsvi(0.1, 0.4, hue = huef)
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, water)
+    vxl.fill_plane(63, water)
 
-    for Δx, Δy in product(range(0, 64), range(-32, 33)):
-        vxl.set_point(256 - 64 - Δx, 256 + Δy, 62, concrete)
-        vxl.set_point(256 + 64 + Δx, 256 + Δy, 62, concrete)
+    vxl.fill_plane(62, concrete, 256 - 64 - 63, 256 - 32, 256 - 64, 256 + 32)
+    vxl.fill_plane(62, concrete, 256 + 64, 256 - 32, 256 + 64 + 63, 256 + 32)
 
     for Δx in range(64):
-        for Δy in range(Δx // 2 + 1):
-            vxl.set_point(256 - Δx, 256 + Δy, 62, concrete)
-            vxl.set_point(256 - Δx, 256 - Δy, 62, concrete)
-            vxl.set_point(256 + Δx, 256 + Δy, 62, concrete)
-            vxl.set_point(256 + Δx, 256 - Δy, 62, concrete)
-
-    vxl.set_point(256, 256, 62, concrete)
+        vxl.fill_plane(62, concrete, 256 - Δx, 256 - Δx // 2, 256 - Δx, 256 + Δx // 2)
+        vxl.fill_plane(62, concrete, 256 + Δx, 256 - Δx // 2, 256 + Δx, 256 + Δx // 2)
 
     return vxl
 
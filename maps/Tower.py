@@ -69,11 +69,10 @@ CONCRETE = (0xCC, 0xCC, 0xCC)
 STEEL    = (0xAA, 0xAA, 0xAA)
 
 def square(vxl, X, Y, Z, size, color):
-    for i in range(-size, size + 1):
-        vxl.set_point(X + i, Y - size, Z, color)
-        vxl.set_point(X + i, Y + size, Z, color)
-        vxl.set_point(X - size, Y + i, Z, color)
-        vxl.set_point(X + size, Y + i, Z, color)
+    vxl.fill_box(X - size, Y - size, Z, X + size, Y - size, Z, color)
+    vxl.fill_box(X - size, Y + size, Z, X + size, Y + size, Z, color)
+    vxl.fill_box(X - size, Y - size, Z, X - size, Y + size, Z, color)
+    vxl.fill_box(X + size, Y - size, Z, X + size, Y + size, Z, color)
 
 def dotted_square(vxl, X, Y, Z, size, color):
     for i in range(-size, size + 1):
@@ -86,15 +85,14 @@ def dotted_square(vxl, X, Y, Z, size, color):
 def stairs(vxl, X, Y, offset, size, color):
     height = 2 * size + 1
 
+    # stairs
     for i in range(-size, size + 1):
-        # stairs
-        for j in range(-size + 1, size):
-            vxl.set_point(X + i, Y + j, offset - (i + size), color)
+        Z = offset - (i + size)
+        vxl.fill_box(X + i, Y - size + 1, Z, X + i, Y + size - 1, Z, color)
 
-        # wall
-        for k in range(0, height + 1):
-            vxl.set_point(X + i, Y - size, offset - k, color)
-            vxl.set_point(X + i, Y + size, offset - k, color)
+    # wall
+    vxl.fill_box(X - size, Y - size, offset - height, X + size, Y - size, offset, color)
+    vxl.fill_box(X - size, Y + size, offset - height, X + size, Y + size, offset, color)
 
     # platform
     square(vxl, X, Y, offset - height, size + 1, color)
@@ -104,30 +102,29 @@ def stairs(vxl, X, Y, offset, size, color):
     # columns around the stairs
     for k in range(0, height): dotted_square(vxl, X, Y, offset - k, size + 3, color)
 
+# concrete slab with the steel columns under it, `z2` is the lowest point of the columns
+def slab(vxl, z1, z2):
+    vxl.fill_box(256 - 64, 256 - 64, z1, 256 + 64, 256 - 32, z1, CONCRETE)
+    vxl.fill_box(256 - 64, 256 + 32, z1, 256 + 64, 256 + 64, z1, CONCRETE)
+    vxl.fill_box(256 - 64, 256 - 31, z1, 256 - 32, 256 + 31, z1, CONCRETE)
+    vxl.fill_box(256 + 32, 256 - 31, z1, 256 + 64, 256 + 31, z1, CONCRETE)
+
+    if z1 < z2:
+        for x, y in product(range(-64, 65, 4), range(-64, 65, 4)):
+            if max(abs(x), abs(y)) >= 32:
+                vxl.fill_column(256 + x, 256 + y, z1 + 1, z2, STEEL)
+
 # first floor & columns under the building
 def basement(vxl, offset):
-    for x, y in product(range(-64, 65), range(-64, 65)):
-        if max(abs(x), abs(y)) >= 32:
-            vxl.set_point(256 + x, 256 + y, offset, CONCRETE)
-
-            if x % 4 == 0 and y % 4 == 0:
-                for z in range(offset + 1, 63):
-                    vxl.set_point(256 + x, 256 + y, z, STEEL)
+    slab(vxl, offset, 62)
 
 def floor(vxl, offset, k):
-    for x, y in product(range(-64, 65), range(-64, 65)):
-        if max(abs(x), abs(y)) >= 32:
-            vxl.set_point(256 + x, 256 + y, offset - 8 * k, CONCRETE)
-
-            if x % 4 == 0 and y % 4 == 0:
-                for z in range(offset - 8 * k + 1, offset - 8 * (k - 1)):
-                    vxl.set_point(256 + x, 256 + y, z, STEEL)
+    slab(vxl, offset - 8 * k, offset - 8 * (k - 1) - 1)
 
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, WATER)
+    vxl.fill_plane(63, WATER)
 
     offset = 60
     basement(vxl, offset)
@@ -1,5 +1,3 @@
-from itertools import product
-
 from pyspades.common import make_color
 
 from milsim.types import StaticWeather
@@ -21,11 +19,8 @@ fog      = rgen.hsvi(0.1, 0.4, hue = huef)
 def on_map_generation(dirname, seed):
     vxl = VxlData()
 
-    for x, y in product(range(512), range(512)):
-        vxl.set_point(x, y, 63, water)
-
-    for x, y in product(range(64, 512 - 64), (255, 256)):
-        vxl.set_point(x, y, 62, concrete)
+    vxl.fill_plane(63, water)
+    vxl.fill_plane(62, concrete, 64, 255, 512 - 64 - 1, 256)
 
     return vxl
 
@@ -71,33 +71,33 @@ ilen   = lambda it: sum(1 for o in it)
 iempty = lambda it: next(it, None) is None
 
 def apply_item(klass, player, errmsg = None):
-    it = filter(lambda o: isinstance(o, klass), player.inventory)
-
-    if o := next(it, None):
+    if o := player.inventory.first(klass):
         return o.apply(player)
     else:
         return errmsg
 
 def has_item(player, klass):
-    return any(map(lambda o: isinstance(o, klass), player.inventory))
+    return player.inventory.count(klass) > 0
 
 def take_item(player, klass):
-    for i, o in player.get_available_items():
-        if isinstance(o, klass):
+    for i in player.get_available_inventory():
+        if o := i.first(klass):
             i.remove(o); player.inventory.push(o)
             yield o; return
 
 def take_items(player, klass, n, nmax):
-    navail = sum(map(lambda o: isinstance(o, klass), player.inventory))
+    navail = player.inventory.count(klass)
 
     for k in range(clamp(0, nmax - navail, n)):
         yield from take_item(player, klass)
 
-def format_item(o):
+def format_item(o, count = 1):
+    name = o.name if count <= 1 else "{} ×{}".format(o.name, count)
+
     if o.persistent:
-        return "[{}] {}".format(o.id, o.name)
+        return "[{}] {}".format(o.id, name)
     else:
-        return "{{{}}} {}".format(o.id, o.name)
+        return "{{{}}} {}".format(o.id, name)
 
 def format_taken_items(os):
     iss = ", ".join(format_item(o) for o in os)
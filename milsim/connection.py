@@ -1,7 +1,8 @@
 from random import choice, uniform
-from math import floor, copysign
+from math import floor, ceil, copysign
 from itertools import product
 from time import monotonic
+import enet
 
 from twisted.internet import reactor
 from twisted.logger import Logger
@@ -16,11 +17,11 @@ from pyspades.constants import *
 
 from piqueserver.player import FeatureConnection
 
-from milsim.common import grenade_zone, TNT, gram, ilen, iempty, floor3, clamp
+from milsim.common import grenade_zone, TNT, gram, floor3, clamp
 from milsim.blast import sendGrenadePacket, explode, flashbang_effect
 from milsim.types import Inventory, Body, randbool, logistic
 from milsim.items import HandgrenadeItem
-from milsim.constants import Limb
+from milsim.constants import Limb, ENET_PEER_PACKET_LOSS_SCALE, MAP_CHUNK_SIZE
 
 GRENADE_LETHAL_RADIUS = 4
 GRENADE_SAFETY_RADIUS = 30
@@ -56,6 +57,42 @@ def milsim_default_loadout(self):
 
 log = Logger()
 
+class SavedLoaders:
+    """
+    Join backlog that keeps only the latest BUILD_BLOCK/DESTROY_BLOCK per voxel.
+    Such a packet is moved to the end, so it is still replayed after everything
+    that preceded it (for example, the SetColor that the build depends on).
+    """
+
+    def __init__(self, it = ()):
+        self.index = 0
+        self.data  = {}
+
+        for data in it:
+            self.append(data)
+
+    @staticmethod
+    def key(data):
+        # BlockAction: id, player_id, value, x, y, z (3 × int32)
+        if isinstance(data, bytes) and len(data) == 15 and data[0] == loaders.BlockAction.id:
+            if data[2] == BUILD_BLOCK or data[2] == DESTROY_BLOCK:
+                return data[3:]
+
+    def append(self, data):
+        if (k := self.key(data)) is not None:
+            self.data.pop(k, None)
+        else:
+            k = self.index
+            self.index += 1
+
+        self.data[k] = data
+
+    def __iter__(self):
+        return iter(self.data.values())
+
+    def __len__(self):
+        return len(self.data)
+
 class MilsimConnection(FeatureConnection):
     default_loadout = milsim_default_loadout
 
@@ -69,6 +106,13 @@ class MilsimConnection(FeatureConnection):
 
     body_mass = 70
 
+    # Number of `MapChunk` packets sent per round trip, see `MilsimConnection.map_chunk_budget`.
+    # It starts at the fixed number sent before, and `map_peer_bandwidth` never holds a peer below that.
+    map_initial_window = 10
+
+    map_window      = map_initial_window
+    map_window_time = 0.0 # When `map_window` was last changed
+
     def __init__(self, *w, **kw):
         FeatureConnection.__init__(self, *w, **kw)
 
@@ -79,12 +123,80 @@ class MilsimConnection(FeatureConnection):
         self.inventory      = Inventory()
 
         self.last_hp_update = None
-        self.body           = Body()
+        self.body           = Body(self.protocol.body_state)
 
-        self.previous_floor_position = None
+        self.protocol.body_players[self.body.slot] = self
 
         self.spade_friendly_fire = False
 
+    def _connection_ack(self):
+        self._send_connection_data()
+        self.protocol.request_map_data(self)
+
+        if not self.client_info:
+            self.send_contained(loaders.HandShakeInit())
+
+    def map_chunk_budget(self):
+        """
+        Returns the number of `MapChunk` packets to send now. Once per round trip, the window grows
+        while the peer keeps up and is halved on packet loss. It is capped by what `map_peer_bandwidth`
+        allows in one round trip, and then by what remains of the upload rate shared by all downloads.
+        """
+
+        peer = self.peer
+        loss = peer.packetLoss / ENET_PEER_PACKET_LOSS_SCALE
+        rtt  = max(peer.roundTripTime, 1) / 1000 # `roundTripTime` is in milliseconds
+
+        t = monotonic()
+
+        if t - self.map_window_time >= rtt:
+            if loss > 0.05:
+                self.map_window = max(1, self.map_window // 2)
+                self.map_window_time = t
+            elif loss < 0.01:
+                self.map_window += 2
+                self.map_window_time = t
+
+        # Bandwidth-delay product.
+        if (bandwidth := self.protocol.map_peer_bandwidth) > 0:
+            limit = max(self.map_initial_window, ceil(bandwidth * rtt / MAP_CHUNK_SIZE))
+            self.map_window = min(self.map_window, limit)
+
+        return self.protocol.reserve_map_chunks(self.map_window)
+
+    def send_map(self, data = None):
+        if data is not None:
+            self.map_data = data
+
+            contained = loaders.MapStart()
+            contained.size = data.get_size()
+            self.send_contained(contained)
+        elif self.map_data is None:
+            return
+
+        if not self.map_data.data_left():
+            self.map_data = None
+
+            for data in self.saved_loaders:
+                packet = enet.Packet(bytes(data), enet.PACKET_FLAG_RELIABLE)
+                self.peer.send(0, packet)
+
+            self.saved_loaders = None
+            self.on_join()
+            return
+
+        for _ in range(self.map_chunk_budget()):
+            if not self.map_data.data_left():
+                break
+
+            contained = loaders.MapChunk()
+            contained.data = self.map_data.read(MAP_CHUNK_SIZE)
+            self.send_contained(contained)
+
+    def _send_connection_data(self):
+        FeatureConnection._send_connection_data(self)
+        self.saved_loaders = SavedLoaders(self.saved_loaders)
+
     def on_reload_complete(self):
         pass
 
@@ -106,10 +218,10 @@ class MilsimConnection(FeatureConnection):
         self.send_contained(contained)
 
     def handgrenades(self):
-        return filter(lambda o: isinstance(o, HandgrenadeItem), self.inventory)
+        return self.inventory.of(HandgrenadeItem)
 
     def sync(self):
-        if self.blocks <= 0 or self.grenades <= 0 and not iempty(self.handgrenades()):
+        if self.blocks <= 0 or self.grenades <= 0 and self.inventory.count(HandgrenadeItem) > 0:
             self.blocks = 50 # due to the limitations of protocol we simply assume that each player has unlimited blocks
             self.grenades = 3 # this is what shown to player, not the actual count
 
@@ -126,7 +238,7 @@ class MilsimConnection(FeatureConnection):
 
         self.sendWeaponReloadPacket()
 
-        if self.tool == GRENADE_TOOL and iempty(self.handgrenades()):
+        if self.tool == GRENADE_TOOL and self.inventory.count(HandgrenadeItem) <= 0:
             # make GRENADE_TOOL unavailable to user
             if self.weapon_object.enabled():
                 self.set_tool(WEAPON_TOOL)
@@ -175,10 +287,15 @@ class MilsimConnection(FeatureConnection):
 
             x, y, z = floor3(r)
 
-            for X, Y in product(range(x - 1, x + 2), range(y - 1, y + 2)):
-                if Z := self.protocol.map.get_z(X, Y, zmin = z, zmax = z + 4):
-                    if i := self.protocol.get_item_entity(X, Y, Z):
-                        yield i
+            index = self.protocol.item_index
+
+            if index.occupied(x - 1, y - 1, x + 1, y + 1):
+                for X, Y in product(range(x - 1, x + 2), range(y - 1, y + 2)):
+                    if (X, Y) not in index: continue
+
+                    if Z := self.protocol.map.get_z(X, Y, zmin = z, zmax = z + 4):
+                        if i := self.protocol.get_item_entity(X, Y, Z):
+                            yield i
 
             if vector_collision(r, self.protocol.team_1.base):
                 yield self.protocol.team1_tent_inventory
@@ -210,11 +327,20 @@ class MilsimConnection(FeatureConnection):
 
     def gear_mass(self):
         return (
-            sum(map(lambda o: o.mass, self.inventory)) +
+            self.inventory.mass +
             self.spade_object.mass + self.block_object.mass +
             self.weapon_object.mass + self.grenade_object.mass
         )
 
+    def busy(self):
+        """
+        Whether something that needs per-tick work is in progress, see `MilsimProtocol.schedule`.
+        """
+
+        o = self.world_object
+
+        return o.primary_fire or o.secondary_fire or o.sneak or self.weapon_object.reloading
+
     def item_shown(self, t):
         P = not self.world_object.sprint
         Q = 0.5 <= t - self.last_sprint
@@ -222,20 +348,6 @@ class MilsimConnection(FeatureConnection):
 
         return P and Q and R
 
-    def on_position_update(self):
-        if self.previous_floor_position is not None:
-            r1, r2 = self.previous_floor_position, self.floor()
-
-            M = self.protocol.map
-            for x, y, z in cube_line(*r1, *r2):
-                if M.get_solid(x, y, z):
-                    if e := self.protocol.get_tile_entity(x, y, z):
-                        e.on_pressure()
-
-            self.previous_floor_position = r2
-
-        FeatureConnection.on_position_update(self)
-
     def on_orientation_update(self, x, y, z):
         ε = 1e-9
 
@@ -264,6 +376,7 @@ class MilsimConnection(FeatureConnection):
         if self.world_object.sneak != sneak:
             if sneak:
                 self.tool_object.on_sneak_press()
+                self.protocol.schedule(self)
             else:
                 self.tool_object.on_sneak_release()
 
@@ -280,7 +393,7 @@ class MilsimConnection(FeatureConnection):
         if self.body.arml.fractured or self.body.armr.fractured:
             return False
 
-        if tool == GRENADE_TOOL and iempty(self.handgrenades()):
+        if tool == GRENADE_TOOL and self.inventory.count(HandgrenadeItem) <= 0:
             return False
 
         return FeatureConnection.on_tool_set_attempt(self, tool)
@@ -302,8 +415,6 @@ class MilsimConnection(FeatureConnection):
     def on_spawn(self, pos):
         self.last_spawn_time = monotonic()
 
-        self.previous_floor_position = self.floor()
-
         self.tool_object = self.weapon_object
         self.tool_object.on_tool_equipped(None)
 
@@ -363,6 +474,13 @@ class MilsimConnection(FeatureConnection):
 
         FeatureConnection.on_disconnect(self)
 
+        self.protocol.active_players.discard(self)
+        self.protocol.body_players.pop(self.body.slot, None)
+
+        # The slot can be taken by someone else, while this object could still be referenced.
+        self.body.release()
+        self.body = Body()
+
     def reset(self):
         if self.player_id is not None:
             self.protocol.engine.on_despawn(self.player_id)
@@ -437,6 +555,16 @@ class MilsimConnection(FeatureConnection):
 
         self.on_flag_taken()
 
+    # Both of these are called *before* the BlockAction packet is sent,
+    # but `protocol` only records the change until the end of the tick.
+    def on_block_build(self, x, y, z):
+        FeatureConnection.on_block_build(self, x, y, z)
+        self.protocol.on_block_build(x, y, z)
+
+    def on_block_removed(self, x, y, z):
+        FeatureConnection.on_block_removed(self, x, y, z)
+        self.protocol.on_block_destroy(x, y, z)
+
     def grenade_destroy(self, x, y, z):
         if x < 0 or x > 512 or y < 0 or y > 512 or z < 0 or z > 63:
             return False
@@ -444,11 +572,12 @@ class MilsimConnection(FeatureConnection):
         if self.on_block_destroy(x, y, z, GRENADE_DESTROY) == False:
             return False
 
-        for X, Y, Z in grenade_zone(x, y, z):
-            self.protocol.engine.smash(self.player_id, X, Y, Z, TNT(gram(60)))
+        self.protocol.engine.smash_region(self.player_id, Vertex3(x, y, z), 1, TNT(gram(60)))
 
-            if e := self.protocol.get_tile_entity(X, Y, Z):
-                e.on_explosion()
+        if self.protocol.tile_index.occupied(x - 1, y - 1, x + 1, y + 1):
+            for X, Y, Z in grenade_zone(x, y, z):
+                if e := self.protocol.get_tile_entity(X, Y, Z):
+                    e.on_explosion()
 
         return True
 
@@ -602,6 +731,9 @@ class MilsimConnection(FeatureConnection):
 
             self.world_object.secondary_fire = secondary
 
+        if primary or secondary:
+            self.protocol.schedule(self)
+
         if self.filter_weapon_input:
             return
 
@@ -767,7 +899,7 @@ class MilsimConnection(FeatureConnection):
             self.grenade_object.on_tool_used()
 
     def create_grenade(self, r, v, fuse, sender = None):
-        if o := next(self.handgrenades(), None):
+        if o := self.inventory.first(HandgrenadeItem):
             self.inventory.remove(o)
 
             grenade = self.protocol.world.create_object(
@@ -799,7 +931,7 @@ class MilsimConnection(FeatureConnection):
 
         self.handle_grenade_packet(x, y, z, vx, vy, vz, contained.value)
 
-        rem = ilen(self.handgrenades())
+        rem = self.inventory.count(HandgrenadeItem)
         self.send_chat("{} grenade(s) left".format(rem))
 
         if self.grenades <= 0 or rem <= 0:
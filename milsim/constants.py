@@ -4,6 +4,12 @@ Pound = 0.45359237
 Yard  = 0.9144
 Inch  = 0.0254
 
+# `enet.Peer.packetLoss` is a fixed-point fraction with this scale.
+ENET_PEER_PACKET_LOSS_SCALE = 1 << 16
+
+# Size of the `MapChunk` packet payload.
+MAP_CHUNK_SIZE = 8192
+
 class Limb(Enum):
     head  = 0
     torso = 1
@@ -6,6 +6,8 @@ from milsim.common import toMeters, dot, xOy, azimuth, needle
 from milsim.types import Item
 
 class Kettlebell(Item):
+    __slots__ = ('mass',)
+
     def __init__(self, mass):
         Item.__init__(self)
         self.mass = mass
@@ -15,6 +17,8 @@ class Kettlebell(Item):
         return f"Kettlebell ({self.mass:.0f} kg)"
 
 class BandageItem(Item):
+    __slots__ = ()
+
     name = "Bandage"
     mass = 0.250
 
@@ -29,6 +33,8 @@ class BandageItem(Item):
         return "You are not bleeding"
 
 class TourniquetItem(Item):
+    __slots__ = ()
+
     name = "Tourniquet"
     mass = 0.050
 
@@ -46,6 +52,8 @@ class TourniquetItem(Item):
             return "You are not bleeding"
 
 class SplintItem(Item):
+    __slots__ = ()
+
     name = "Splint"
     mass = 0.160
 
@@ -60,6 +68,8 @@ class SplintItem(Item):
         return "You have no fractures"
 
 class CompassItem(Item):
+    __slots__ = ()
+
     name = "Compass"
     mass = 0.050
 
@@ -70,6 +80,8 @@ class CompassItem(Item):
         return "{:.0f} deg, {}".format(θ, needle(φ))
 
 class ProtractorItem(Item):
+    __slots__ = ('origin',)
+
     name = "Protractor"
     mass = 0.150
 
@@ -94,6 +106,8 @@ class ProtractorItem(Item):
             return "{:.2f} deg".format(θ)
 
 class RangefinderItem(Item):
+    __slots__ = ()
+
     name  = "Rangefinder"
     mass  = 0.300
     error = 2.0
@@ -115,9 +129,11 @@ class RangefinderItem(Item):
             return "Too far."
 
 class HandgrenadeItem(Item):
-    pass
+    __slots__ = ()
 
 class F1GrenadeItem(HandgrenadeItem):
+    __slots__ = ()
+
     name = "F-1 Grenade"
     mass = 0.600
 
@@ -125,6 +141,8 @@ class F1GrenadeItem(HandgrenadeItem):
         return player.grenade_exploded
 
 class StunHandgrenadeItem(HandgrenadeItem):
+    __slots__ = ()
+
     name = "M84 Stun Grenade"
     mass = 0.370
 
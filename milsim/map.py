@@ -1,18 +1,231 @@
 from itertools import chain, islice, repeat
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from random import randint, Random
 from time import monotonic
-from random import randint
 from zlib import crc32
+from array import array
+import importlib.metadata
+import importlib.util
+import multiprocessing
+import threading
+import marshal
+import hashlib
+import struct
+import pickle
+import mmap
+import zlib
 import os
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from twisted.internet import threads
 from twisted.logger import Logger
 
 from piqueserver.map import MapNotFound
 from piqueserver.config import config
 
 from milsim.types import Environment
+from milsim.engine import Material
+from milsim.vxl import VxlData
 
 log = Logger()
 
+section = config.section("milsim")
+
+map_cache = section.option("map_cache", True).get()
+
+# Directory of the cached maps. Several servers can point this to the same directory, then a map is generated
+# by one of them (see `cache_lock`) and loaded from the cache by the others. Each server still decodes it
+# into its own `VxlData`, so this saves the generation time but not memory.
+map_cache_dir = section.option("map_cache_dir", None).get()
+
+# Bump this whenever the format of the cache files changes, changes of the code are detected by `get_code_hash`.
+CACHE_FORMAT = 2
+
+def get_cache_dir():
+    return map_cache_dir or os.path.join(config.config_dir, 'cache', 'maps')
+
+code_hash = None
+
+def get_code_hash():
+    """
+    Hash of the milsim modules (including the native ones) and the pyspades version,
+    so that the cached maps are regenerated after an update of anything they could be made with.
+    """
+
+    global code_hash
+
+    if code_hash is None:
+        h = hashlib.sha256()
+
+        try:
+            h.update(importlib.metadata.version('piqueserver').encode('utf-8'))
+        except importlib.metadata.PackageNotFoundError:
+            pass
+
+        dirname = os.path.dirname(os.path.abspath(__file__))
+
+        for filename in sorted(os.listdir(dirname)):
+            if filename.endswith(('.py', '.so', '.pyd')):
+                with open(os.path.join(dirname, filename), 'rb') as fin:
+                    h.update(filename.encode('utf-8'))
+                    h.update(fin.read())
+
+        code_hash = h.hexdigest()
+
+    return code_hash
+
+# Stamps of the external files read while the map is generated in this thread, see `depend`.
+tracking = threading.local()
+
+def depend(filepath):
+    """
+    Called by the map tools that read external files (such as `maptools.load_vxl`),
+    so that the cached map is regenerated when any of them changes.
+    """
+
+    if (deps := getattr(tracking, 'deps', None)) is not None:
+        st = os.stat(filepath)
+        deps[os.path.abspath(filepath)] = st.st_mtime_ns, st.st_size
+
+def check_dependencies(deps):
+    for filepath, stamp in deps.items():
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return False
+
+        if (st.st_mtime_ns, st.st_size) != stamp:
+            return False
+
+    return True
+
+@contextmanager
+def cache_lock(path):
+    """
+    Makes sure that only one process (a server sharing `map_cache_dir` or the worker of `prefetch`)
+    generates the map at a time, the others wait and then read it from the cache.
+    """
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        yield
+        return
+
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        yield
+    finally:
+        os.close(fd)
+
+# Both are keyed by the path of the map script and are valid as long as its stamp does not change.
+code_cache   = {}
+static_cache = {}
+
+def get_stamp(fin):
+    st = os.fstat(fin.fileno())
+    return st.st_mtime_ns, st.st_size
+
+# Stamps of the map scripts that turned out to be not cacheable, these are not prefetched (see `prefetch`).
+uncached = {}
+
+def compile_cached(source, filename, filepath, stamp):
+    """
+    Same as `compile(source, filename, 'exec')`, but the code object is kept in memory and marshalled to the disk.
+    """
+
+    if (o := code_cache.get(filepath)) is not None and o[0] == stamp:
+        return o[1]
+
+    header = importlib.util.MAGIC_NUMBER + struct.pack('<QQ', *stamp)
+    path   = os.path.join(config.config_dir, 'cache', 'code', hashlib.sha256(filepath.encode('utf-8')).hexdigest())
+
+    code = None
+
+    try:
+        with open(path, 'rb') as fin:
+            data = fin.read()
+
+        if data.startswith(header):
+            code = marshal.loads(data[len(header):])
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+
+    if code is None:
+        code = compile(source, filename, 'exec')
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+
+            with open(path + '.tmp', 'wb') as fout:
+                fout.write(header + marshal.dumps(code))
+
+            os.replace(path + '.tmp', path)
+        except OSError as exc:
+            log.warn("Failed to cache the code of “{filepath}”: {exc}", filepath = filepath, exc = exc)
+
+    code_cache[filepath] = stamp, code
+
+    return code
+
+def make_static(filepath, stamp):
+    """
+    Returns the `static` decorator available to map scripts. The decorated function is called only
+    the first time the map is loaded, and is replaced by its return value, which is reused by later loads
+    until the script is modified. This is meant for pure data (palettes, spawn locations and so on)
+    that must never be mutated.
+    """
+
+    def static(fun):
+        key = filepath, fun.__name__
+
+        if (o := static_cache.get(key)) is not None and o[0] == stamp:
+            return o[1]
+
+        value = fun()
+        static_cache[key] = stamp, value
+
+        return value
+
+    return static
+
+def encode_defaults(namespace, defaults):
+    names = {id(v): k for k, v in namespace.items() if isinstance(v, Material)}
+
+    items, table, indices, materials = [], [], array('I'), array('H')
+
+    for (x, y, z), M in defaults:
+        items.append(((x, y, z), M))
+
+        # Materials are stored by the name of the global variable, so that they can be found after the reload.
+        if table is not None:
+            if (k := names.get(id(M))) is None:
+                table = None
+                continue
+
+            if k not in table:
+                table.append(k)
+
+            indices.append(x + (y << 9) + (z << 18))
+            materials.append(table.index(k))
+
+    return items, None if table is None else (table, indices, materials)
+
+def decode_defaults(namespace, overlays):
+    table, indices, materials = overlays
+    table = [namespace[k] for k in table]
+
+    for i, k in zip(indices, materials):
+        yield (i & 511, (i >> 9) & 511, i >> 18), table[k]
+
 def seed():
     return randint(0, 2 << 30)
 
@@ -34,6 +247,9 @@ class RotationInfo:
         else:
             self.seed = crc32(seed.encode('utf-8'))
 
+        # Seed chosen ahead of time by `prefetch` for maps without an explicit one.
+        self.prefetched_seed = None
+
     def get_filename(self, dirname):
         return "{}.py".format(self.name)
 
@@ -41,7 +257,7 @@ class RotationInfo:
         return os.path.join(dirname, self.get_filename(dirname))
 
 class MapInfo:
-    def __init__(self, rot_info, dirname):
+    def __init__(self, rot_info, dirname, prefetching = False):
         filepath = rot_info.get_filepath(dirname)
 
         try:
@@ -49,6 +265,8 @@ class MapInfo:
         except OSError:
             raise MapNotFound(filepath)
 
+        prefetched, rot_info.prefetched_seed = rot_info.prefetched_seed, None
+
         self.__dict__.update(
             __file__            = filepath,
             __name__            = "__main__",
@@ -57,7 +275,7 @@ class MapInfo:
             author              = "(unknown)",
             version             = "1.0",
             description         = "",
-            seed                = rot_info.seed or seed(),
+            seed                = rot_info.seed or prefetched or seed(),
             extensions          = dict(),
             load_dir            = dirname,
             load_path           = filepath,
@@ -71,6 +289,7 @@ class MapInfo:
             on_flag_capture     = None,
             on_block_destroy    = None,
             is_indestructable   = None,
+            cacheable           = True,
             info                = self, # for the backward compatibility reasons
             self                = self
         )
@@ -78,17 +297,37 @@ class MapInfo:
         log.info("Loading map “{map_name}”...", map_name = self.name)
 
         try:
+            source = fin.read()
+            stamp  = get_stamp(fin)
+
+            self.__dict__.update(static = make_static(filepath, stamp))
+
             exec(
-                compile(fin.read(), rot_info.get_filename(dirname), 'exec'),
+                compile_cached(source, rot_info.get_filename(dirname), filepath, stamp),
                 self.__dict__
             )
         finally:
             fin.close()
 
+        # Path of the cache entry of this map, or None if it is not cached.
+        self.cache_path = None
+
+        if not self.cacheable:
+            uncached[filepath] = stamp
+
+            # The worker process has nothing to do, since its result could not be passed through the cache.
+            if prefetching: return
+
         t1 = monotonic()
 
-        self.data = self.on_map_generation(dirname, self.seed)
-        self.environment = self.on_environment_generation(dirname, self.seed)
+        # Only maps with an explicit seed are cached, otherwise the seed is random and the cache would never be hit.
+        # Prefetched random seeds are looked up as well, but their entries are used only once.
+        if map_cache and self.cacheable and (rot_info.seed is not None or prefetched is not None):
+            self.cache_path = self.get_cache_path(source)
+            self.load_cached(self.cache_path, persistent = rot_info.seed is not None)
+        else:
+            self.data = self.on_map_generation(dirname, self.seed)
+            self.environment = self.on_environment_generation(dirname, self.seed)
 
         t2 = monotonic()
 
@@ -101,11 +340,232 @@ class MapInfo:
                 )
             )
 
+    def get_cache_path(self, source):
+        h = hashlib.sha256(source.encode('utf-8'))
+        h.update("{}:{}:{}".format(self.seed, CACHE_FORMAT, get_code_hash()).encode('utf-8'))
+
+        return os.path.join(get_cache_dir(), h.hexdigest())
+
+    # These are stored so that `on_environment_generation` sees the same RNG state as after `on_map_generation`.
+    def get_random_states(self):
+        return {k: v.getstate() for k, v in self.__dict__.items() if isinstance(v, Random)}
+
+    def read_cached(self, path, persistent):
+        try:
+            with open(path + '.env', 'rb') as fin:
+                states, overlays, deps = pickle.loads(zlib.decompress(fin.read()))
+
+            # One of the files read by the map script has changed, the map is generated again and replaces this one.
+            if not check_dependencies(deps):
+                return False
+
+            with open(path + '.vxl', 'rb') as fin:
+                with mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ) as M:
+                    data = VxlData.load(M)
+        except FileNotFoundError:
+            return False
+        except Exception as exc:
+            log.failure("Failed to load the cached map “{map_name}”: {exc}", map_name = self.name, exc = exc)
+            return False
+
+        for k, state in states.items():
+            self.__dict__[k].setstate(state)
+
+        self.data = data
+        self.environment = self.on_environment_generation(self.load_dir, self.seed)
+
+        if overlays is not None:
+            self.environment.defaults = decode_defaults(self.__dict__, overlays)
+
+        if not persistent:
+            remove_cached(path)
+
+        log.info("Loaded “{map_name}” from the cache", map_name = self.name)
+        return True
+
+    def load_cached(self, path, persistent = True):
+        if self.read_cached(path, persistent):
+            return
+
+        with cache_lock(path):
+            # Another process could have generated the map while we were waiting.
+            if self.read_cached(path, persistent):
+                return
+
+            tracking.deps = deps = {}
+
+            try:
+                self.data = self.on_map_generation(self.load_dir, self.seed)
+                states = self.get_random_states()
+
+                self.environment = self.on_environment_generation(self.load_dir, self.seed)
+            finally:
+                tracking.deps = None
+
+            if persistent and isinstance(self.environment, Environment):
+                items, overlays = encode_defaults(self.__dict__, self.environment.defaults)
+                self.environment.defaults = items if overlays is None else decode_defaults(self.__dict__, overlays)
+
+                try:
+                    # Written to temporary files first, so that a concurrent reader never sees a partial file.
+                    for suffix, data in (
+                        ('.vxl', self.data.generate()),
+                        ('.env', zlib.compress(pickle.dumps((states, overlays, deps))))
+                    ):
+                        with open(path + suffix + '.tmp', 'wb') as fout:
+                            fout.write(data)
+
+                        os.replace(path + suffix + '.tmp', path + suffix)
+                except OSError as exc:
+                    log.warn("Failed to cache the map “{map_name}”: {exc}", map_name = self.name, exc = exc)
+
     def __getattr__(self, attr):
         raise AttributeError(
             "name “{}” is not defined in the map “{}”".format(attr, self.name)
         )
 
+class MapStream:
+    """
+    Compressed map image that is shared by all connections downloading the map.
+    Since it is made only once, it is compressed with the best ratio.
+    """
+
+    def __init__(self, data, revision):
+        raw = data.generate()
+
+        self.revision = revision
+        self.size     = len(raw)
+        self.crc      = crc32(raw)
+        self.data     = zlib.compress(raw, 9)
+
+    def reader(self):
+        return MapStreamReader(self)
+
+class MapStreamReader:
+    """
+    Same interface as `pyspades.mapgenerator.ProgressiveMapGenerator`.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pos    = 0
+
+    def get_size(self):
+        return len(self.stream.data)
+
+    def read(self, size):
+        data = self.stream.data[self.pos:self.pos + size]
+        self.pos += len(data)
+
+        return data
+
+    def data_left(self):
+        return self.pos < len(self.stream.data)
+
+class Lookahead:
+    """
+    Iterator wrapper that allows to see the next map in the rotation without advancing it.
+    """
+
+    def __init__(self, it):
+        self.it = iter(it)
+        self.buffer = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.buffer:
+            return self.buffer.pop()
+
+        return next(self.it)
+
+    def peek(self):
+        if not self.buffer:
+            self.buffer.append(next(self.it))
+
+        return self.buffer[0]
+
+executor = None
+
+def remove_cached(path):
+    # The lock file is kept, since another process could be waiting on it, and removing it
+    # would let a third one lock a new file with the same name and generate the map at the same time.
+    for suffix in '.vxl', '.env':
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+def generate(full_name, dirname, config_dir, cache_dir):
+    global map_cache_dir
+
+    config.config_dir = config_dir
+    map_cache_dir     = cache_dir
+
+    # Called in the worker process only for the side effect of filling the cache.
+    return MapInfo(RotationInfo(full_name), dirname, prefetching = True).cache_path
+
+def prefetch(rot_info, dirname):
+    """
+    Generates the map in a worker process, so that the following `MapInfo(rot_info, dirname)`
+    is loaded from the cache instead of holding the GIL for the whole generation.
+    Returns a Deferred that fires with the path of the cache entry (None if the map is not cacheable)
+    when the worker is done, or None if the cache is disabled or the map is known to be not cacheable.
+    """
+
+    global executor
+
+    if not map_cache:
+        return None
+
+    filepath = rot_info.get_filepath(dirname)
+
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+
+    if uncached.get(filepath) == (st.st_mtime_ns, st.st_size):
+        return None
+
+    if rot_info.seed is None and rot_info.prefetched_seed is None:
+        rot_info.prefetched_seed = seed()
+
+    if executor is None:
+        # “spawn” is used since forking a process with the running reactor and its threads is not safe.
+        executor = ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context('spawn'))
+
+    full_name = "{}#{}".format(rot_info.name, rot_info.seed or rot_info.prefetched_seed)
+    future = executor.submit(generate, full_name, dirname, config.config_dir, get_cache_dir())
+
+    def done(path):
+        # Nothing was cached, so the main process generates the map with a random seed as usual.
+        if path is None:
+            uncached[filepath] = st.st_mtime_ns, st.st_size
+            rot_info.prefetched_seed = None
+
+        return path
+
+    return threads.deferToThread(future.result).addCallback(done)
+
+def discard_prefetched(rot_info, d):
+    """
+    Called instead of `MapInfo(rot_info, dirname)` when the map prefetched by `prefetch` will not be loaded.
+    The cache entry made for a random seed would never be used, so it is removed once the worker is done.
+    """
+
+    if rot_info.seed is not None or rot_info.prefetched_seed is None:
+        return
+
+    rot_info.prefetched_seed = None
+
+    def done(path):
+        if path is not None:
+            remove_cached(path)
+
+    d.addCallback(done)
+
 def check_map(map_name, dirname):
     rot_info = RotationInfo(map_name)
 
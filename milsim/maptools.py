@@ -2,11 +2,13 @@ from random import uniform, choice, Random as RandomClass
 from colorsys import hsv_to_rgb
 from itertools import product
 from math import floor
+import mmap
 import os
 
 from pyspades.constants import BLUE_FLAG, GREEN_FLAG, BLUE_BASE, GREEN_BASE
 
 from milsim.vxl import VxlData
+from milsim.map import depend
 from milsim.builtin import *
 from milsim.common import *
 
@@ -24,8 +26,11 @@ def failure(connection):
     return NotImplementedError
 
 def load_vxl(vxlpath):
+    depend(vxlpath)
+
     with open(vxlpath, 'rb') as fin:
-        return VxlData(fin)
+        with mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ) as M:
+            return VxlData.load(M)
 
 def VXL(filename):
     def retfun(dirname, seed):
@@ -61,18 +66,62 @@ def is_location_free(M, w):
            M.get_solid(x, y, z - 1) == 0 and \
            M.get_solid(x, y, z - 0) == 1
 
+class Grid:
+    """
+    Sequence of the locations (x, y, z) for every z in `zs` over the rectangle, or of its columns (x, y) if `zs` is None.
+    """
+
+    def __init__(self, xmin, xmax, ymin, ymax, zs = None):
+        self.xmin, self.xmax = xmin, xmax
+        self.ymin, self.ymax = ymin, ymax
+
+        self.zs     = zs
+        self.width  = xmax - xmin + 1
+        self.height = ymax - ymin + 1
+        self.depth  = 1 if zs is None else len(zs)
+
+    def __len__(self):
+        return self.width * self.height * self.depth
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+
+        i, k = divmod(i, self.depth)
+        y, x = divmod(i, self.width)
+
+        x, y = self.xmin + x, self.ymin + y
+
+        return (x, y) if self.zs is None else (x, y, self.zs[k])
+
+    def __contains__(self, w):
+        x, y = w[:2]
+        return self.xmin <= x <= self.xmax and self.ymin <= y <= self.ymax
+
+    def ordinal(self, x, y, k = 0):
+        return ((y - self.ymin) * self.width + (x - self.xmin)) * self.depth + k
+
 def Bitmap(x1 = 0, y1 = 0, x2 = 512, y2 = 512, zs = []):
     xmin, xmax = min(x1, x2), max(x1, x2)
     ymin, ymax = min(y1, y2), max(y1, y2)
 
-    L0 = list(product(range(xmin, xmax + 1), range(ymin, ymax + 1), zs))
+    grid = Grid(xmin, xmax, ymin, ymax, zs)
+
+    # `is_location_free` at (x, y, z) depends on the blocks from z − 3 to z.
+    def locate(x, y, z):
+        if (x, y) in grid:
+            for k, zk in enumerate(zs):
+                if 0 <= zk - z <= 3:
+                    yield grid.ordinal(x, y, k)
 
     def retfun(connection):
-        M = connection.protocol.map
+        protocol = connection.protocol
+        index = protocol.get_spawn_index(retfun, grid, is_location_free, locate)
+
+        if (w := index.sample()) is not None:
+            return w
 
-        # Not the most performant solution but *seems* to be robust enough.
-        L = list(filter(lambda w: is_location_free(M, w), L0))
-        return choice(L) if len(L) > 0 else uniform2(M, xmin, xmax, ymin, ymax)
+        return uniform2(protocol.map, xmin, xmax, ymin, ymax)
 
     return retfun
 
@@ -0,0 +1,241 @@
+from time import perf_counter, strftime
+from queue import SimpleQueue, Empty
+from traceback import format_stack
+from array import array
+from math import ceil
+import threading
+import sys
+import os
+
+from twisted.python.logfile import LogFile
+from twisted.internet import reactor
+from twisted.logger import Logger
+
+from piqueserver.config import config
+
+log = Logger()
+
+section = config.section("milsim")
+
+# Ticks longer than that (s) are reported by the `Watchdog`, zero turns it off.
+tick_budget = section.option("tick_budget", 0.05).get()
+
+watchdog_log = section.option("watchdog_log", None).get()
+
+def get_watchdog_log():
+    return watchdog_log or os.path.join(config.config_dir, 'logs', 'watchdog.log')
+
+class Histogram:
+    """
+    Rolling window of the last `size` samples, quantiles are only computed when asked for.
+    """
+
+    __slots__ = ('samples', 'index', 'count')
+
+    def __init__(self, size):
+        self.samples = array('d', bytes(8 * size))
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.index] = value
+
+        self.index = (self.index + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+
+    def __len__(self):
+        return self.count
+
+    def quantiles(self, *qs):
+        xs = sorted(self.samples[:self.count])
+
+        if not xs: return tuple(0.0 for q in qs)
+
+        return tuple(xs[max(0, ceil(q * len(xs)) - 1)] for q in qs)
+
+    def summary(self):
+        """Returns (p50, p99, max)."""
+        return self.quantiles(0.50, 0.99, 1.00)
+
+class TickProfiler:
+    """
+    Time (s) spent in every phase of a tick. `start` is called at the beginning of the tick
+    and `mark(phase)` at the end of each phase, so a phase takes the time since the previous mark.
+    """
+
+    window = 1024 # Samples kept for every phase, about 17 s at 60 ticks per second
+
+    def __init__(self):
+        self.histograms = {}
+
+        # State of the current (or the last) tick, also read by the `Watchdog` thread.
+        self.ticks   = 0
+        self.current = None # (ticks, t0) of the running tick, published in a single assignment
+        self.phase   = None
+        self.phases  = {}
+        self.elapsed = 0.0
+        self.t0      = self.t = perf_counter()
+
+    def histogram(self, phase):
+        if (o := self.histograms.get(phase)) is None:
+            o = self.histograms[phase] = Histogram(self.window)
+
+        return o
+
+    def start(self):
+        self.ticks  += 1
+        self.phase   = None
+        self.phases  = {}
+        self.t0      = self.t = perf_counter()
+        self.current = (self.ticks, self.t0)
+
+    def mark(self, phase):
+        t = perf_counter()
+
+        self.histogram(phase).add(t - self.t)
+        self.phases[phase] = t - self.t
+
+        self.phase = phase
+        self.t     = t
+
+    def stop(self, phase = 'tick'):
+        """Records the whole tick under `phase` and returns its duration."""
+        self.current = None
+        self.elapsed = perf_counter() - self.t0
+
+        self.histogram(phase).add(self.elapsed)
+
+        return self.elapsed
+
+    def add(self, phase, value):
+        self.histogram(phase).add(value)
+
+    def timed(self, phase, fun):
+        """Returns `fun` that records the time of every call under `phase`."""
+
+        def retfun(*w, **kw):
+            t = perf_counter()
+
+            try:
+                return fun(*w, **kw)
+            finally:
+                self.add(phase, perf_counter() - t)
+
+        return retfun
+
+    def reset(self):
+        for o in self.histograms.values():
+            o.reset()
+
+    def items(self):
+        return self.histograms.items()
+
+class Watchdog:
+    """
+    Reports the ticks of `profiler` that run longer than `budget` (s) to a rotating log file.
+    While such a tick is still running, the stack of the reactor thread is captured from this thread,
+    this only works when the reactor releases the GIL, i.e. not in the middle of a long native call.
+    """
+
+    interval          = 0.01    # How often the running tick is checked (s)
+    rotate_length     = 1 << 20 # Size of the log file when it is rotated (byte)
+    max_rotated_files = 5
+
+    def __init__(self, profiler, budget, filename):
+        self.profiler = profiler
+        self.budget   = budget
+        self.filename = filename
+
+        self.ident    = threading.get_ident() # of the reactor thread
+        self.queue    = SimpleQueue()
+        self.captured = None                  # (tick, elapsed, phase, stack)
+        self.stopped  = threading.Event()
+
+        self.thread = threading.Thread(target = self.run, name = "watchdog", daemon = True)
+
+    def start(self):
+        self.thread.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+    def stop(self):
+        self.stopped.set()
+
+    def on_tick(self, engine):
+        """Called by the reactor thread after `profiler.stop()`."""
+        o = self.profiler
+
+        if o.elapsed <= self.budget:
+            return
+
+        captured = self.captured if self.captured and self.captured[0] == o.ticks else None
+        self.queue.put((strftime("%Y-%m-%d %H:%M:%S"), o.ticks, o.elapsed, dict(o.phases), engine.alive, captured))
+
+    def check(self):
+        o = self.profiler
+
+        if (current := o.current) is None:
+            return
+
+        ticks, t0 = current
+
+        if self.captured and self.captured[0] == ticks:
+            return
+
+        if (elapsed := perf_counter() - t0) > self.budget:
+            phase = o.phase
+
+            if frame := sys._current_frames().get(self.ident):
+                stack = "".join(format_stack(frame))
+
+                # The tick may have ended while the stack was taken, then it belongs to another tick.
+                if o.current is current:
+                    self.captured = (ticks, elapsed, phase, stack)
+
+    def run(self):
+        dirname, basename = os.path.split(os.path.abspath(self.filename))
+        os.makedirs(dirname, exist_ok = True)
+
+        fout = LogFile(basename, dirname, rotateLength = self.rotate_length, maxRotatedFiles = self.max_rotated_files)
+
+        try:
+            while not self.stopped.is_set():
+                try:
+                    report = self.queue.get(timeout = self.interval)
+                except Empty:
+                    report = None
+
+                if report is not None:
+                    fout.write(self.format(*report))
+                    fout.flush()
+
+                self.check()
+        except Exception:
+            log.failure("Watchdog failed")
+        finally:
+            fout.close()
+
+    def format(self, timestamp, ticks, elapsed, phases, alive, captured):
+        ms = lambda t: "{:.2f} ms".format(t * 1e+3)
+
+        longest = max(phases, key = phases.get, default = None)
+
+        lines = [
+            "{} tick #{} took {} (budget {}), {} object(s) in flight".format(
+                timestamp, ticks, ms(elapsed), ms(self.budget), alive
+            ),
+            "  longest phase: {}".format(longest),
+            "  phases: {}".format(", ".join("{} {}".format(k, ms(v)) for k, v in phases.items()))
+        ]
+
+        if captured is not None:
+            _, t, phase, stack = captured
+
+            lines.append("  stack at {} into the tick, after {}:".format(ms(t), phase or "the start"))
+            lines.extend("  " + line for line in stack.rstrip().split("\n"))
+        else:
+            lines.append("  stack was not captured")
+
+        return "\n".join(lines) + "\n\n"
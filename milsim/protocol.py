@@ -1,14 +1,16 @@
-from itertools import islice
+from itertools import islice, chain
 from time import monotonic
 from random import choice
 import os
 
 from twisted.internet import threads
+from twisted.internet.defer import succeed
 from twisted.logger import Logger
 
 import pyspades.contained as loaders
 from pyspades.common import Vertex3
 from pyspades.constants import *
+from pyspades.mapgenerator import ProgressiveMapGenerator
 
 from piqueserver.server import FeatureProtocol
 from piqueserver.config import config
@@ -21,33 +23,31 @@ from milsim.packets import (
 
 from milsim.weapon import ABCWeapon, Rifle, SMG, Shotgun, HEIMagazine
 from milsim.vxl import onDeleteQueue, deleteQueueClear
-from milsim.map import MapInfo, check_rotation
-from milsim.constants import Limb, HitEffect
+from milsim.map import MapInfo, MapStream, Lookahead, check_rotation, prefetch, discard_prefetched
+from milsim.profiler import TickProfiler, Watchdog, tick_budget, get_watchdog_log
+from milsim.constants import Limb, HitEffect, MAP_CHUNK_SIZE
 from milsim.engine import Engine
 from milsim.common import *
 
 from milsim.items import Kettlebell, CompassItem, ProtractorItem, RangefinderItem, StunHandgrenadeItem
 from milsim.underbarrel import GrenadeLauncher, GrenadeItem, FlashbangItem
 from milsim.builtin import Buckshot0000, Buckshot00, Bullet
-from milsim.types import CartridgeBox
+from milsim.types import CartridgeBox, ItemStack, StackedInventory, SpawnIndex, ColumnIndex, BodyState
 
 def milsim_default_tent_loadout(self):
-    for k in range(90):
-        yield from (
-            GrenadeLauncher(),
-            GrenadeItem(),
-            GrenadeItem(),
-            GrenadeItem(),
-            FlashbangItem(),
-            CompassItem(),
-            ProtractorItem(),
-            RangefinderItem(),
-            CartridgeBox(Buckshot0000, 60),
-            CartridgeBox(Buckshot00, 60),
-            CartridgeBox(Bullet, 50),
-            HEIMagazine(),
-            StunHandgrenadeItem()
-        )
+    yield from (
+        ItemStack(90,  GrenadeLauncher),
+        ItemStack(270, GrenadeItem),
+        ItemStack(90,  FlashbangItem),
+        ItemStack(90,  CompassItem),
+        ItemStack(90,  ProtractorItem),
+        ItemStack(90,  RangefinderItem),
+        ItemStack(90,  CartridgeBox, Buckshot0000, 60),
+        ItemStack(90,  CartridgeBox, Buckshot00, 60),
+        ItemStack(90,  CartridgeBox, Bullet, 50),
+        ItemStack(90,  HEIMagazine),
+        ItemStack(90,  StunHandgrenadeItem)
+    )
 
     yield from (
         Kettlebell(1),
@@ -60,6 +60,12 @@ def milsim_default_tent_loadout(self):
 
 log = Logger()
 
+section = config.section("milsim")
+
+# Upload rates (byte/s) of all map downloads together and of a single one, zero turns the limit off.
+map_bandwidth      = section.option("map_bandwidth", 8 * 1024 * 1024).get()
+map_peer_bandwidth = section.option("map_peer_bandwidth", 4 * 1024 * 1024).get()
+
 class MilsimProtocol(FeatureProtocol):
     default_tent_loadout = milsim_default_tent_loadout
 
@@ -68,18 +74,67 @@ class MilsimProtocol(FeatureProtocol):
     BlockTool   = BlockTool
     GrenadeTool = GrenadeTool
 
+    # Minimal delay (in seconds) between the updates of the shared compressed map made in the background,
+    # joining clients that find it outdated make it updated right away (see `MilsimProtocol.request_map_data`).
+    map_stream_interval = 5
+
+    # See `map_bandwidth` and `map_peer_bandwidth` above.
+    map_bandwidth      = map_bandwidth
+    map_peer_bandwidth = map_peer_bandwidth
+
     def __init__(self, *w, **kw):
         self.map_dir = os.path.join(config.config_dir, 'maps')
 
         self.environment = None
         self.engine      = Engine(self)
+        self.body_state  = BodyState()
+        self.profiler    = TickProfiler()
+        self.watchdog    = None
+
+        # Wrapped instead of overridden, so that it is timed even when a script (such as aos076)
+        # overrides it without calling the base method.
+        self.update_network = self.profiler.timed('network', self.update_network)
+
+        if tick_budget > 0:
+            self.watchdog = Watchdog(self.profiler, tick_budget, get_watchdog_log())
+            self.watchdog.start()
+
+        # Players by their `BodyState` slot, and the ones that need per-tick work (see `MilsimProtocol.schedule`).
+        self.body_players   = {}
+        self.active_players = set()
         self.time        = monotonic()
 
         self.tile_entities = {}
         self.item_entities = {}
 
-        self.team1_tent_inventory = Inventory()
-        self.team2_tent_inventory = Inventory()
+        # Columns of the entities above, see `ColumnIndex`.
+        self.tile_index = ColumnIndex()
+        self.item_index = ColumnIndex()
+
+        # Side effects of block changes are postponed until the end of the tick,
+        # see `MilsimProtocol.flush_block_journal`.
+        self.built_blocks      = set()
+        self.destroyed_blocks  = set()
+        self.entities_outdated = False
+
+        # Indices of free spawn locations of the current map, see `MilsimProtocol.get_spawn_index`.
+        self.spawn_indices = {}
+
+        # The (rot_info, deferred) pair of the map being generated in the worker process.
+        self.map_prefetch = None
+
+        # Incremented on every block change, so that an outdated `map_stream` is not sent.
+        self.map_revision       = 0
+        self.map_stream         = None
+        self.map_stream_pending = None # The map that is being compressed
+        self.map_stream_time    = monotonic()
+        self.map_waiters        = []   # (revision, connection) pairs waiting for a newer `map_stream`
+
+        self.map_tokens      = 0
+        self.map_tokens_time = monotonic()
+
+        self.team1_tent_inventory = StackedInventory()
+        self.team2_tent_inventory = StackedInventory()
 
         self.rifle   = type('Rifle',   (Rifle,   self.WeaponTool), dict())
         self.smg     = type('SMG',     (SMG,     self.WeaponTool), dict())
@@ -92,10 +147,51 @@ class MilsimProtocol(FeatureProtocol):
 
     def set_map_rotation(self, maps):
         self.maps = check_rotation(maps, self.map_dir)
-        self.map_rotator = self.map_rotator_type(self.maps)
+        self.map_rotator = Lookahead(self.map_rotator_type(self.maps))
+
+    @property
+    def planned_map(self):
+        return self.__dict__.get('planned_map')
+
+    @planned_map.setter
+    def planned_map(self, rot_info):
+        self.__dict__['planned_map'] = rot_info
+        self.prefetch_map(rot_info)
+
+    def prefetch_map(self, rot_info):
+        if rot_info is None:
+            return
+
+        if self.map_prefetch is not None and self.map_prefetch[0] is rot_info:
+            return
+
+        self.discard_map_prefetch()
+
+        if (d := prefetch(rot_info, self.map_dir)) is not None:
+            d.addErrback(
+                lambda failure: log.failure(
+                    "Failed to prefetch the map “{map_name}”", failure, map_name = rot_info.name
+                )
+            )
+
+            self.map_prefetch = rot_info, d
+
+    def discard_map_prefetch(self):
+        if self.map_prefetch is not None:
+            other, d = self.map_prefetch
+            self.map_prefetch = None
+
+            discard_prefetched(other, d)
 
     def make_map(self, rot_info):
-        return threads.deferToThread(MapInfo, rot_info, self.map_dir)
+        d = succeed(None)
+
+        if self.map_prefetch is not None and self.map_prefetch[0] is rot_info:
+            d, self.map_prefetch = self.map_prefetch[1], None
+        else:
+            self.discard_map_prefetch()
+
+        return d.addCallback(lambda _: threads.deferToThread(MapInfo, rot_info, self.map_dir))
 
     def on_connect(self, peer):
         log.info("{address} connected", address = peer.address)
@@ -111,6 +207,14 @@ class MilsimProtocol(FeatureProtocol):
         if weapon == SHOTGUN_WEAPON:
             return self.shotgun
 
+    def schedule(self, player):
+        """
+        Makes the player updated every tick, until `player.busy()` is false.
+        Wounded players are updated anyway.
+        """
+
+        self.active_players.add(player)
+
     def living(self):
         for player in self.players.values():
             if player.alive():
@@ -127,6 +231,17 @@ class MilsimProtocol(FeatureProtocol):
 
     def add_tile_entity(self, klass, *w, **kw):
         entity = klass(*w, **kw)
+
+        x, y, z = entity.position
+
+        if entity.position not in self.tile_entities:
+            self.tile_index.add(x, y)
+
+        if entity.pressure_sensitive:
+            self.engine.add_pressure(x, y, z)
+        else:
+            self.engine.remove_pressure(x, y, z)
+
         self.tile_entities[entity.position] = entity
 
         return entity
@@ -136,12 +251,15 @@ class MilsimProtocol(FeatureProtocol):
 
     def remove_tile_entity(self, x, y, z):
         self.tile_entities.pop((x, y, z))
+        self.tile_index.discard(x, y)
+        self.engine.remove_pressure(x, y, z)
 
     def get_item_entity(self, x, y, z):
         return self.item_entities.get((x, y, z))
 
     def remove_item_entity(self, x, y, z):
         self.item_entities.pop((x, y, z))
+        self.item_index.discard(x, y)
 
     def new_item_entity(self, x, y, z):
         if o := self.item_entities.get((x, y, z)):
@@ -149,6 +267,7 @@ class MilsimProtocol(FeatureProtocol):
         else:
             o = ItemEntity(self, x, y, z)
             self.item_entities[(x, y, z)] = o
+            self.item_index.add(x, y)
 
             return o
 
@@ -164,6 +283,9 @@ class MilsimProtocol(FeatureProtocol):
         self.tile_entities.clear()
         self.item_entities.clear()
 
+        self.tile_index.clear()
+        self.item_index.clear()
+
         self.team1_tent_inventory.clear()
         self.team2_tent_inventory.clear()
 
@@ -184,21 +306,157 @@ class MilsimProtocol(FeatureProtocol):
 
     def on_block_build(self, x, y, z):
         self.engine[x, y, z] = self.build_material
-
-        if e := self.get_tile_entity(x, y, z + 1):
-            e.on_pressure()
+        self.built_blocks.add((x, y, z))
+        self.map_revision += 1
 
     def on_block_destroy(self, x, y, z):
         del self.engine[x, y, z]
+        self.destroyed_blocks.add((x, y, z))
+        self.map_revision += 1
+
+    def request_map_data(self, connection):
+        """
+        Starts the map download of `connection` with a reader of the shared compressed map. If the map was changed
+        since it was compressed, the download waits for the next one, while the block changes are already saved
+        to `connection.saved_loaders` (some of them may then be replayed over the map that has them, as usual).
+        Only until the first compressed image of the map is ready, a generator for this connection is used.
+        """
+
+        if (o := self.map_stream) is None:
+            self.update_map_stream()
+            connection.send_map(ProgressiveMapGenerator(self.map))
+        elif o.revision == self.map_revision:
+            connection.send_map(o.reader())
+        else:
+            self.map_waiters.append((self.map_revision, connection))
+            self.update_map_stream()
 
-        if e := self.get_tile_entity(x, y, z):
-            e.on_destroy()
+    def serve_map_waiters(self):
+        waiters, self.map_waiters = self.map_waiters, []
 
-        self.drop_item_entity(x, y, z)
+        for revision, connection in waiters:
+            if connection.disconnected:
+                continue
 
-    def on_map_change(self, M):
+            if self.map_stream is None:
+                connection.send_map(ProgressiveMapGenerator(self.map))
+            elif revision <= self.map_stream.revision:
+                connection.send_map(self.map_stream.reader())
+            else:
+                self.map_waiters.append((revision, connection))
+
+        # These have joined after the copy was taken.
+        if self.map_waiters:
+            self.update_map_stream()
+
+    def reserve_map_chunks(self, n):
+        """
+        Token bucket shared by all map downloads, returns how many of the `n` chunks can be sent now.
+        """
+
+        if self.map_bandwidth <= 0:
+            return n
+
+        t = monotonic()
+
+        # At most one second worth of the bandwidth can be saved up.
+        self.map_tokens = min(self.map_bandwidth, self.map_tokens + (t - self.map_tokens_time) * self.map_bandwidth)
+        self.map_tokens_time = t
+
+        n = min(n, int(self.map_tokens // MAP_CHUNK_SIZE))
+        self.map_tokens -= n * MAP_CHUNK_SIZE
+
+        return n
+
+    def update_map_stream(self):
+        M = self.map
+
+        # A stream of the previous map could still be in progress, it is ignored when done.
+        if self.map_stream_pending is M:
+            return
+
+        def done(stream):
+            if self.map_stream_pending is M:
+                self.map_stream_pending = None
+
+            # The map could have been changed in the meantime.
+            if self.map is M:
+                self.map_stream = stream
+                self.serve_map_waiters()
+
+        def failed(failure):
+            if self.map_stream_pending is M:
+                self.map_stream_pending = None
+
+            log.failure("Failed to compress the map", failure)
+
+            # Otherwise they would wait forever.
+            if self.map is M:
+                self.map_stream = None
+                self.serve_map_waiters()
+
+        self.map_stream_pending = M
+        self.map_stream_time    = monotonic()
+
+        # The copy is compressed in a thread, while the map itself can be modified.
+        # It is the only part done in the reactor thread, once for all of the clients waiting for this stream.
+        d = threads.deferToThread(MapStream, M.copy(), self.map_revision)
+        d.addCallbacks(done, failed)
+
+    def update_entities(self):
+        self.entities_outdated = True
+
+    def flush_block_journal(self):
+        self.destroyed_blocks.update(islice(onDeleteQueue(), 50))
+        self.profiler.mark('delete queue')
+
+        if self.entities_outdated:
+            self.entities_outdated = False
+            FeatureProtocol.update_entities(self)
+
+        built,     self.built_blocks     = self.built_blocks,     set()
+        destroyed, self.destroyed_blocks = self.destroyed_blocks, set()
+
+        for x, y, z in destroyed:
+            if e := self.get_tile_entity(x, y, z):
+                e.on_destroy()
+
+            self.drop_item_entity(x, y, z)
+
+        for x, y, z in built:
+            if e := self.get_tile_entity(x, y, z + 1):
+                e.on_pressure()
+
+        for index in self.spawn_indices.values():
+            for x, y, z in chain(built, destroyed):
+                index.on_block_change(x, y, z)
+
+        if (o := self.map_stream) is not None and o.revision != self.map_revision:
+            if monotonic() - self.map_stream_time > self.map_stream_interval:
+                self.update_map_stream()
+
+    def get_spawn_index(self, key, candidates, check, locate):
+        """
+        Returns the `SpawnIndex` of the given candidates for the current map, it is built on the first call.
+        """
+
+        if (index := self.spawn_indices.get(key)) is None:
+            index = self.spawn_indices[key] = SpawnIndex(self.map, candidates, check, locate)
+
+        return index
+
+    def clear_block_journal(self):
         deleteQueueClear()
 
+        self.spawn_indices.clear()
+
+        self.built_blocks.clear()
+        self.destroyed_blocks.clear()
+        self.entities_outdated = False
+
+    def on_map_change(self, M):
+        self.clear_block_journal()
+
         for player in self.players.values():
             player.weapon_object.clear()
             player.inventory.clear()
@@ -208,6 +466,13 @@ class MilsimProtocol(FeatureProtocol):
 
         FeatureProtocol.on_map_change(self, M)
 
+        # Started right away, since most of the players reconnect just after the map change.
+        # Until it is ready, `request_map_data` falls back to a generator per connection.
+        # Clients still waiting for a stream of the previous map are sent the new map by `set_map`.
+        self.map_stream  = None
+        self.map_waiters = []
+        self.update_map_stream()
+
         for i in self.team1_tent_inventory, self.team2_tent_inventory:
             i.extend(self.default_tent_loadout())
 
@@ -217,8 +482,12 @@ class MilsimProtocol(FeatureProtocol):
 
         log.info("Environment loading took {duration:.2f} s", duration = t2 - t1)
 
+        self.prefetch_map(self.planned_map or self.map_rotator.peek())
+
     def on_world_update(self):
-        t = monotonic()
+        t0, t = self.time, monotonic()
+
+        self.profiler.start()
 
         if o := self.environment:
             dt = t - self.time
@@ -226,30 +495,41 @@ class MilsimProtocol(FeatureProtocol):
             if o.weather.update(dt):
                 self.update_weather()
 
+        self.profiler.mark('weather')
+
         self.engine.step(self.time, t)
+        self.profiler.mark('engine.step')
+
+        self.engine.sweep()
+        self.profiler.mark('engine.sweep')
+
         self.time = t
 
-        for x, y, z in islice(onDeleteQueue(), 50):
-            if e := self.get_tile_entity(x, y, z):
-                e.on_destroy()
+        # Only the players that are wounded or have something in progress need the work below.
+        active = set(self.active_players)
 
-            self.drop_item_entity(x, y, z)
+        for slot in self.body_state.wounded():
+            if player := self.body_players.get(slot):
+                active.add(player)
 
-        for player in self.living():
-            dt = t - player.last_hp_update
+        active = sorted(filter(lambda player: player.alive(), active), key = lambda player: player.player_id)
 
-            player.body.update(dt)
+        # Bleeding and the wear of fractured limbs for everyone at once.
+        self.body_state.update([
+            (
+                player.body.slot, t - max(t0, player.last_hp_update),
+                player.world_object.sprint, player.moving(),
+                player.world_object.airborne, player.world_object.primary_fire
+            ) for player in active
+        ])
 
-            for leg in player.body.legs():
-                if leg.fractured and not player.world_object.airborne:
-                    if player.world_object.sprint:
-                        leg.hit(leg.sprint_damage_rate * dt)
-                    elif player.moving():
-                        if not leg.splint: leg.hit(leg.walk_damage_rate * dt)
+        for player in active:
+            # Could have been killed by someone else during this loop.
+            if player.dead():
+                self.active_players.discard(player)
+                continue
 
-            for arm in player.body.arms():
-                if player.world_object.primary_fire and arm.fractured:
-                    arm.hit(arm.action_damage_rate * dt)
+            dt = t - max(t0, player.last_hp_update)
 
             player.weapon_object.update(t)
 
@@ -267,34 +547,28 @@ class MilsimProtocol(FeatureProtocol):
             if player.hp != hp:
                 player.set_hp(hp, kill_type = MELEE_KILL)
 
-            if not self.environment.size.inside(player.world_object.position):
-                player.kill()
-
             player.last_hp_update = t
 
-        FeatureProtocol.on_world_update(self)
+            if not player.busy():
+                self.active_players.discard(player)
 
-    def broadcast_contained(self, contained, unsequenced = False, sender = None, team = None, save = False, rule = None):
-        FeatureProtocol.broadcast_contained(self, contained, unsequenced, sender, team, save, rule)
+        # Positions are changed by the physics every tick, so this one is still done for everyone.
+        for player in self.living():
+            if not self.environment.size.inside(player.world_object.position):
+                player.kill()
 
-        if isinstance(contained, loaders.BlockAction):
-            x, y, z = contained.x, contained.y, contained.z
+        self.profiler.mark('players')
 
-            # This is intentionally not in `connection.on_block_build`, so that `protocol.on_block_build`
-            # is called *after* the BlockAction packet has been sent.
-            if contained.value == BUILD_BLOCK:
-                self.on_block_build(x, y, z)
+        FeatureProtocol.on_world_update(self)
+        self.profiler.mark('world update')
 
-            if contained.value == DESTROY_BLOCK:
-                self.on_block_destroy(x, y, z)
+        self.flush_block_journal()
+        self.profiler.mark('block journal')
 
-            if contained.value == SPADE_DESTROY:
-                for X, Y, Z in (x, y, z), (x, y, z - 1), (x, y, z + 1):
-                    self.on_block_destroy(X, Y, Z)
+        self.profiler.stop()
 
-            if contained.value == GRENADE_DESTROY:
-                for X, Y, Z in grenade_zone(x, y, z):
-                    self.on_block_destroy(X, Y, Z)
+        if self.watchdog is not None:
+            self.watchdog.on_tick(self.engine)
 
     def onTrace(self, index, x, y, z, value, origin):
         self.broadcast_contained(
@@ -303,26 +577,35 @@ class MilsimProtocol(FeatureProtocol):
         )
 
     def onDestroy(self, player_id, x, y, z):
+        self.onDestroyMany(player_id, ((x, y, z),))
+
+    def onDestroyMany(self, player_id, blocks):
         player = self.players.get(player_id)
 
         if player is None:
             return
 
-        count = self.map.destroy_point(x, y, z)
+        for x, y, z in blocks:
+            count = self.map.destroy_point(x, y, z)
+
+            if count > 0:
+                contained           = loaders.BlockAction()
+                contained.x         = x
+                contained.y         = y
+                contained.z         = z
+                contained.value     = DESTROY_BLOCK
+                contained.player_id = player_id
 
-        if count > 0:
-            contained           = loaders.BlockAction()
-            contained.x         = x
-            contained.y         = y
-            contained.z         = z
-            contained.value     = DESTROY_BLOCK
-            contained.player_id = player_id
+                self.broadcast_contained(contained, save = True)
 
-            self.broadcast_contained(contained, save = True)
-            self.update_entities()
+                player.on_block_removed(x, y, z)
+                player.total_blocks_removed += count
 
-            player.on_block_removed(x, y, z)
-            player.total_blocks_removed += count
+                self.update_entities()
+
+    def onPressure(self, player_id, x, y, z):
+        if e := self.get_tile_entity(x, y, z):
+            e.on_pressure()
 
     def onBlockHit(self, o, x, y, z, vx, vy, vz, X, Y, Z, thrower, E, A):
         self.broadcast_contained(
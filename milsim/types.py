@@ -2,23 +2,29 @@ from typing import Dict, List, Callable, Tuple
 from dataclasses import dataclass, field
 from collections.abc import Iterable
 from collections import deque
+from itertools import chain
+from contextlib import contextmanager
+from array import array
 from time import monotonic
 
 from math import pi, exp, log, inf, nan, floor, prod, sin, cos
-from random import random, gauss
+from random import random, gauss, choice
 
 from pyspades.color import interpolate_rgb
 from pyspades.constants import SPADE_TOOL
 from pyspades.common import Vertex3
 
 from milsim.constants import Pound, Inch, Limb
-from milsim.engine import Material
+from milsim.engine import Material, BodyState, VENOUS, ARTERIAL, FRACTURED, SPLINT
 
 randbool = lambda prob: random() <= prob
 
 impl = lambda P, Q: not P or Q
 ite = lambda b, v1, v2: v1 if b else v2
 
+# Items of an `Inventory` from the pushed ones (newest first) to the appended ones (oldest first).
+chained = lambda front, back: chain(reversed(front), back)
+
 @dataclass
 class Box:
     xmin : float = -inf
@@ -137,6 +143,123 @@ class Environment:
         v, d = self.weather.wind()
         return self.ofPolar(v, d)
 
+class SpawnIndex:
+    """
+    Set of the free spawn locations among `candidates` (a sequence), sampled in O(1).
+    `check(M, w)` tells whether the location `w` is free, and `locate(x, y, z)` returns
+    the positions in `candidates` of the locations that depend on the block at (x, y, z),
+    see `MilsimProtocol.flush_block_journal`.
+    """
+
+    def __init__(self, M, candidates, check, locate):
+        self.map        = M
+        self.candidates = candidates
+        self.check      = check
+        self.locate     = locate
+
+        # Positions of the free candidates, and where each candidate is in that array (or −1).
+        self.free     = array('l')
+        self.position = array('l', [-1]) * len(candidates)
+
+        for i, w in enumerate(candidates):
+            if check(M, w):
+                self.add(i)
+
+    def add(self, i):
+        if self.position[i] < 0:
+            self.position[i] = len(self.free)
+            self.free.append(i)
+
+    def discard(self, i):
+        if (k := self.position[i]) >= 0:
+            self.position[i] = -1
+            last = self.free.pop()
+
+            if k < len(self.free):
+                self.free[k] = last
+                self.position[last] = k
+
+    def update(self, i):
+        if self.check(self.map, self.candidates[i]):
+            self.add(i)
+        else:
+            self.discard(i)
+
+    def on_block_change(self, x, y, z):
+        for i in self.locate(x, y, z):
+            self.update(i)
+
+    def sample(self):
+        # Checked once more in case some change was missed (e.g. it came from a script that bypassed the protocol).
+        while len(self.free) > 0:
+            i = choice(self.free)
+            w = self.candidates[i]
+
+            if self.check(self.map, w):
+                return w
+
+            self.discard(i)
+
+    def __len__(self):
+        return len(self.free)
+
+class ColumnIndex:
+    """
+    Columns that hold at least one entity, with a coarse occupancy grid of `2^shift × 2^shift`
+    cells on top of them, so that the lookups around a player can be skipped all at once.
+    """
+
+    __slots__ = ('shift', 'width', 'cells', 'columns')
+
+    def __init__(self, size = 512, shift = 3):
+        self.shift   = shift
+        self.width   = size >> shift
+        self.cells   = array('l', [0]) * (self.width * self.width)
+        self.columns = {} # (x, y) → number of entities in that column
+
+    def cell(self, x, y):
+        return (y >> self.shift) * self.width + (x >> self.shift)
+
+    def add(self, x, y):
+        self.columns[x, y] = self.columns.get((x, y), 0) + 1
+        self.cells[self.cell(x, y)] += 1
+
+    def discard(self, x, y):
+        if n := self.columns.get((x, y)):
+            if n > 1:
+                self.columns[x, y] = n - 1
+            else:
+                del self.columns[x, y]
+
+            self.cells[self.cell(x, y)] -= 1
+
+    def clear(self):
+        self.cells = array('l', [0]) * len(self.cells)
+        self.columns.clear()
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def occupied(self, x1, y1, x2, y2):
+        """
+        Whether some column of the rectangle between (x1, y1) and (x2, y2) may hold an entity.
+        """
+
+        if not self.columns:
+            return False
+
+        s, w = self.shift, self.width
+
+        i1, i2 = max(0, min(x1, x2) >> s), min(w - 1, max(x1, x2) >> s)
+        j1, j2 = max(0, min(y1, y2) >> s), min(w - 1, max(y1, y2) >> s)
+
+        for j in range(j1, j2 + 1):
+            for i in range(i1, i2 + 1):
+                if self.cells[j * w + i] > 0:
+                    return True
+
+        return False
+
 @dataclass
 class Cartridge:
     name      : str   # Projectile name
@@ -202,16 +325,34 @@ class Linear(ABCMap):
         t = (v - self.v1) / (self.v2 - self.v1)
         return self.w1 + t * (self.w2 - self.w1)
 
-@dataclass
+def limbflag(flag):
+    return property(
+        lambda self: self.state.get_flag(self.index, flag),
+        lambda self, value: self.state.set_flag(self.index, flag, value)
+    )
+
 class ABCLimb:
-    abbrev    : str
-    label     : str
+    """
+    View of a single limb in `BodyState`.
+    """
+
+    __slots__ = ('abbrev', 'label', 'state', 'index')
+
+    def __init__(self, abbrev, label, body, limb):
+        self.abbrev = abbrev
+        self.label  = label
+        self.state  = body.state
+        self.index  = body.slot * len(Limb) + limb.value
+
+    hp = property(
+        lambda self: self.state.get_hp(self.index),
+        lambda self, value: self.state.set_hp(self.index, value)
+    )
 
-    hp        : int  = 100
-    venous    : bool = False
-    arterial  : bool = False
-    fractured : bool = False
-    splint    : bool = False
+    venous    = limbflag(VENOUS)
+    arterial  = limbflag(ARTERIAL)
+    fractured = limbflag(FRACTURED)
+    splint    = limbflag(SPLINT)
 
     bleeding = ABCMap()
     fracture = ABCMap()
@@ -235,20 +376,17 @@ class ABCLimb:
         return damage, venous, arterial, fractured
 
     def hit(self, value):
-        if value <= 0: return
-        self.hp = max(0, self.hp - value)
+        self.state.hit(self.index, value)
 
     def reset(self):
-        self.hp        = 100
-        self.venous    = False
-        self.arterial  = False
-        self.fractured = False
-        self.splint    = False
+        self.state.reset_limb(self.index)
 
     def on_fracture(self, player):
         pass
 
 class Torso(ABCLimb):
+    __slots__ = ()
+
     venous_rate      = 0.7
     arterial_rate    = 2.8
     arterial_density = 0.4
@@ -258,6 +396,8 @@ class Torso(ABCLimb):
     rotation_damage  = 0.1
 
 class Head(ABCLimb):
+    __slots__ = ()
+
     venous_rate      = 1.0
     arterial_rate    = 4.3
     arterial_density = 0.65
@@ -266,6 +406,8 @@ class Head(ABCLimb):
     damage           = Linear(0, 500)
 
 class Arm(ABCLimb):
+    __slots__ = ()
+
     venous_rate        = 0.35
     arterial_rate      = 1.7
     arterial_density   = 0.7
@@ -278,6 +420,8 @@ class Arm(ABCLimb):
         player.set_tool(SPADE_TOOL)
 
 class Leg(ABCLimb):
+    __slots__ = ()
+
     venous_rate        = 0.55
     arterial_rate      = 2.1
     arterial_density   = 0.75
@@ -289,14 +433,28 @@ class Leg(ABCLimb):
     walk_damage_rate   = 3.5
     jump_damage        = 9.0
 
+# Classes of the limbs in the order of `Limb`.
+limbs = (Head, Torso, Arm, Arm, Leg, Leg)
+
 class Body:
-    def __init__(self):
-        self.torso = Torso("torso", "torso")
-        self.head  = Head("head", "head")
-        self.arml  = Arm("arml", "left arm")
-        self.armr  = Arm("armr", "right arm")
-        self.legl  = Leg("legl", "left leg")
-        self.legr  = Leg("legr", "right leg")
+    """
+    View of a single slot in `BodyState`, a standalone one is made if `state` is not given.
+    `limbs` are the classes of the limbs in the order of `Limb`.
+    """
+
+    def __init__(self, state = None, limbs = limbs):
+        self.state = BodyState() if state is None else state
+        self.slot  = self.state.acquire(limbs)
+
+        self.torso = limbs[Limb.torso.value]("torso", "torso",     self, Limb.torso)
+        self.head  = limbs[Limb.head.value]("head",   "head",      self, Limb.head)
+        self.arml  = limbs[Limb.arml.value]("arml",   "left arm",  self, Limb.arml)
+        self.armr  = limbs[Limb.armr.value]("armr",   "right arm", self, Limb.armr)
+        self.legl  = limbs[Limb.legl.value]("legl",   "left leg",  self, Limb.legl)
+        self.legr  = limbs[Limb.legr.value]("legr",   "right leg", self, Limb.legr)
+
+    def release(self):
+        self.state.release(self.slot)
 
     def __getitem__(self, k):
         if k == Limb.torso: return self.torso
@@ -326,26 +484,19 @@ class Body:
         yield self.legr
 
     def average(self):
-        avg = prod(map(lambda P: P.hp / 100, self.values()))
-        return floor(100 * avg)
+        return self.state.average(self.slot)
 
     def bleeding(self):
-        return any(map(lambda P: P.venous or P.arterial, self.values()))
+        return self.state.bleeding(self.slot)
 
     def fractured(self):
-        return any(map(lambda P: P.fractured, self.values()))
+        return self.state.fractured(self.slot)
 
     def reset(self):
-        for P in self.values():
-            P.reset()
+        self.state.reset(self.slot)
 
     def update(self, dt):
-        for P in self.values():
-            if P.arterial:
-                P.hit(P.arterial_rate * dt)
-
-            if P.venous:
-                P.hit(P.venous_rate * dt)
+        self.state.update([(self.slot, dt, False, False, False, False)])
 
 def digits(n, base = 10):
     while n > 0:
@@ -361,6 +512,8 @@ def encode(n, key = ascii_uppercase):
 from itertools import count
 
 class Item:
+    __slots__ = ('id', 'persistent')
+
     idpool = None
 
     @staticmethod
@@ -386,7 +539,15 @@ class Item:
     def name(self):
         raise NotImplementedError
 
+    def current(self):
+        return 0
+
+    def kinds(self):
+        return type(self).__mro__[:-1]
+
 class CartridgeBox(Item):
+    __slots__ = ('object', '_current')
+
     def __init__(self, o, current = 0):
         Item.__init__(self)
 
@@ -401,6 +562,10 @@ class CartridgeBox(Item):
     def current(self):
         return self._current
 
+    def kinds(self):
+        # Also indexed as `(CartridgeBox, C)` for each class `C` of the cartridge.
+        return Item.kinds(self) + tuple((CartridgeBox, C) for C in type(self.object).__mro__[:-1])
+
     @property
     def mass(self):
         return self._current * self.object.totmass
@@ -410,38 +575,129 @@ class CartridgeBox(Item):
         return f"{self.object.name} Box ({self._current})"
 
 class Inventory:
+    """
+    Items ordered by `push` and `append`, indexed by ID and by every kind from `Item.kinds`,
+    with running totals of mass and ammo, so that none of the queries scans the whole inventory.
+    """
+
+    __slots__ = ('front', 'back', 'ids', 'kinds', 'ammo', 'mass')
+
     def __init__(self):
-        self.data = deque()
+        Inventory.clear(self)
 
     def __iter__(self):
-        return iter(self.data)
+        return chained(self.front, self.back)
+
+    def listing(self):
+        """Pairs of items and how many of them there are, as they are shown to players."""
+        return ((o, 1) for o in chained(self.front, self.back))
 
     def __getitem__(self, ID):
-        return next(filter(lambda x: x.id == ID.upper(), self.data), None)
+        return self.ids.get(ID.upper())
+
+    def add(self, o, side):
+        """Puts `o` in front of all items if `side` is 0, and behind them if it is 1."""
+        (self.front, self.back)[side][o] = None
+        self.ids[o.id] = o
+
+        for k in o.kinds():
+            self.kinds.setdefault(k, ({}, {}))[side][o] = None
+
+        self.account(o, +1)
+
+    def discard(self, o):
+        side = 0 if o in self.front else 1
+
+        del (self.front, self.back)[side][o]
+        del self.ids[o.id]
+
+        for k in o.kinds():
+            ends = self.kinds[k]
+            del ends[side][o]
+
+            if not (ends[0] or ends[1]): del self.kinds[k]
+
+        self.account(o, -1)
+
+    def account(self, o, n):
+        """Adds `n` copies of `o` to the totals, or removes them if `n` is negative."""
+        self.mass += n * o.mass
+
+        if c := o.current():
+            for k in o.kinds():
+                if m := self.ammo.get(k, 0) + n * c:
+                    self.ammo[k] = m
+                else:
+                    del self.ammo[k]
+
+        if self.empty():
+            self.mass = 0
+
+    @contextmanager
+    def changing(self, o):
+        """
+        Keeps the totals right while the mass or the ammo count of `o` is changed in place.
+        """
+
+        self.account(o, -1)
+
+        try:
+            yield o
+        finally:
+            self.account(o, +1)
+
+    def of(self, kind):
+        if ends := self.kinds.get(kind):
+            return chained(*ends)
+        else:
+            return iter(())
+
+    def first(self, kind):
+        if ends := self.kinds.get(kind):
+            return next(chained(*ends))
+
+    def count(self, kind):
+        if ends := self.kinds.get(kind):
+            return len(ends[0]) + len(ends[1])
+        else:
+            return 0
+
+    def current(self, kind):
+        return self.ammo.get(kind, 0)
 
     def remove(self, o):
-        self.data.remove(o)
+        self.discard(o)
 
     def remove_if(self, pred):
-        self.data = deque(filter(lambda o: not pred(o), self.data))
+        for o in list(filter(pred, chained(self.front, self.back))):
+            self.discard(o)
 
     def clear(self):
-        self.data.clear()
+        self.front = {} # Pushed items, the last one is the first in the inventory
+        self.back  = {} # Appended items, in their order in the inventory
+        self.ids   = {}
+        self.kinds = {} # Same pair of dicts for every kind
+        self.ammo  = {}
+        self.mass  = 0
 
     def extend(self, it):
-        self.data.extend(it)
+        for o in it:
+            self.add(o, 1)
 
     def push(self, o):
-        self.data.appendleft(o)
+        self.add(o, 0)
+
         return o
 
     def append(self, *w):
-        self.data.extend(w)
+        self.extend(w)
 
     def empty(self):
-        return not bool(self.data)
+        return not bool(self.ids)
 
 class ItemEntity(Inventory):
+    __slots__ = ('x', 'y', 'z', 'protocol')
+
     def __init__(self, protocol, x, y, z):
         Inventory.__init__(self)
 
@@ -466,7 +722,151 @@ class ItemEntity(Inventory):
         Inventory.clear(self)
         self.remove_if_empty()
 
+class ItemStack:
+    """
+    `count` identical items made by `factory(*args)`, only the `top` one of which exists at a time.
+    """
+
+    __slots__ = ('count', 'factory', 'args', 'top')
+
+    def __init__(self, count, factory, *args):
+        self.count   = count
+        self.factory = factory
+        self.args    = args
+        self.top     = factory(*args)
+
+    def pop(self):
+        o = self.top
+
+        self.count -= 1
+        self.top = self.factory(*self.args) if self.count > 0 else None
+
+        return o
+
+class StackedInventory(Inventory):
+    """
+    Inventory that also holds `ItemStack`s, which are listed by their top items
+    and hand out a new instance every time the top item is taken.
+    Each stack counts as `count` copies of its top item in all of the totals.
+    """
+
+    __slots__ = ('stacks', 'tops', 'stacked', 'sizes')
+
+    def __init__(self):
+        Inventory.__init__(self)
+
+        self.stacks  = {}
+        self.tops    = {}
+        self.stacked = {} # Stacks of every kind
+        self.sizes   = {} # Number of stacked items of every kind
+
+    def __iter__(self):
+        yield from Inventory.__iter__(self)
+
+        for s in self.stacks:
+            yield s.top
+
+    def listing(self):
+        yield from Inventory.listing(self)
+
+        for s in self.stacks:
+            yield s.top, s.count
+
+    def __getitem__(self, ID):
+        if s := self.tops.get(ID.upper()):
+            return s.top
+        else:
+            return Inventory.__getitem__(self, ID)
+
+    def resize(self, s, n):
+        for k in s.top.kinds():
+            if m := self.sizes.get(k, 0) + n:
+                self.sizes[k] = m
+            else:
+                del self.sizes[k]
+
+        self.account(s.top, n)
+
+    def attach(self, s):
+        self.stacks[s] = None
+        self.tops[s.top.id] = s
+
+        for k in s.top.kinds():
+            self.stacked.setdefault(k, {})[s] = None
+
+        self.resize(s, +s.count)
+
+    def detach(self, s):
+        del self.stacks[s]
+        del self.tops[s.top.id]
+
+        for k in s.top.kinds():
+            d = self.stacked[k]
+            del d[s]
+
+            if not d: del self.stacked[k]
+
+        self.resize(s, -s.count)
+
+    def remove(self, o):
+        if (s := self.tops.get(o.id)) and s.top is o:
+            if s.count > 1:
+                del self.tops[o.id]
+
+                self.resize(s, -1)
+                s.pop()
+
+                self.tops[s.top.id] = s
+            else:
+                self.detach(s)
+                s.pop()
+        else:
+            Inventory.remove(self, o)
+
+    def remove_if(self, pred):
+        Inventory.remove_if(self, pred)
+
+        for s in list(filter(lambda s: pred(s.top), self.stacks)):
+            self.detach(s)
+
+    def clear(self):
+        Inventory.clear(self)
+
+        self.stacks.clear()
+        self.tops.clear()
+        self.stacked.clear()
+        self.sizes.clear()
+
+    def extend(self, it):
+        for o in it:
+            if isinstance(o, ItemStack):
+                if o.count > 0:
+                    self.attach(o)
+            else:
+                Inventory.extend(self, (o,))
+
+    def append(self, *w):
+        self.extend(w)
+
+    def of(self, kind):
+        return chain(Inventory.of(self, kind), (s.top for s in self.stacked.get(kind, ())))
+
+    def first(self, kind):
+        if o := Inventory.first(self, kind):
+            return o
+
+        if d := self.stacked.get(kind):
+            return next(iter(d)).top
+
+    def count(self, kind):
+        return Inventory.count(self, kind) + self.sizes.get(kind, 0)
+
+    def empty(self):
+        return not (self.ids or self.stacks)
+
 class Magazine(Item):
+    __slots__ = ()
+
     capacity = NotImplemented
 
     @property
@@ -477,6 +877,8 @@ class Magazine(Item):
         raise NotImplementedError
 
 class BoxMagazine(Magazine):
+    __slots__ = ('_current',)
+
     continuous = False
     basemass   = NotImplemented
     basename   = NotImplemented
@@ -487,8 +889,8 @@ class BoxMagazine(Magazine):
 
         self._current = self.capacity
 
-    def reload(self, i):
-        return next(filter(lambda o: o.current() > 0, i), None), False
+    def reload(self, i, reserve):
+        return next(filter(lambda o: o.current() > 0, reserve), None), False
 
     def current(self):
         return self._current
@@ -507,6 +909,8 @@ class BoxMagazine(Magazine):
         return f"{self.basename} ({self._current})"
 
 class TubularMagazine(Magazine):
+    __slots__ = ('container',)
+
     continuous = True
     cartridge  = NotImplemented
 
@@ -518,14 +922,16 @@ class TubularMagazine(Magazine):
     def push(self, o):
         self.container.appendleft(o)
 
-    def reload(self, i):
+    def reload(self, i, reserve):
         if self.capacity <= self.current():
             return None, False
 
-        it = filter(lambda o: o.current() > 0, i)
+        it = filter(lambda o: o.current() > 0, reserve)
 
         if o := next(it, None):
-            self.push(o.pop())
+            with i.changing(o):
+                self.push(o.pop())
+
             return None, True
 
         return None, False
@@ -648,6 +1054,9 @@ class GrenadeTool(Tool):
         self.unpin_time = 0
 
 class TileEntity:
+    # Whether `on_pressure` is called when a player walks over it, see `Engine.sweep`.
+    pressure_sensitive = False
+
     def __init__(self, protocol, position):
         self.protocol = protocol
         self.position = position
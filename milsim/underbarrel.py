@@ -10,6 +10,8 @@ from milsim.common import format_item
 from milsim.types import Item
 
 class GrenadeLauncher(UnderbarrelItem):
+    __slots__ = ('grenade',)
+
     basename = "M203 Grenade Launcher"
 
     def __init__(self):
@@ -44,6 +46,8 @@ class GrenadeLauncher(UnderbarrelItem):
         return 1.36 + getattr(self.grenade, 'mass', 0)
 
 class GrenadeCartridge(Item):
+    __slots__ = ()
+
     def apply(self, player):
         w = player.weapon_object
 
@@ -60,6 +64,8 @@ class GrenadeCartridge(Item):
             return "No grenade launcher to load"
 
 class GrenadeItem(GrenadeCartridge):
+    __slots__ = ()
+
     name   = "M433 Grenade"
     mass   = 0.230
     muzzle = 120
@@ -68,6 +74,8 @@ class GrenadeItem(GrenadeCartridge):
         return player.grenade_exploded
 
 class FlashbangItem(GrenadeCartridge):
+    __slots__ = ()
+
     name   = "Flashbang"
     mass   = 0.200
     muzzle = 120
@@ -9,6 +9,8 @@ from milsim.engine import cone
 from milsim.common import *
 
 class UnderbarrelItem(Item):
+    __slots__ = ()
+
     def on_press(self, player):
         pass
 
@@ -73,11 +75,13 @@ class ABCWeapon(Tool):
             self.weapon_reload_timer = monotonic()
             self.reloading = True
 
+            self.player.protocol.schedule(self.player)
+
     def update(self, t):
         if self.reloading and t - self.weapon_reload_timer >= self.reload_time:
             self.weapon_reload_timer = t
 
-            succ, self.reloading = self.magazine.reload(self.reserve())
+            succ, self.reloading = self.magazine.reload(self.player.inventory, self.reserve())
 
             if succ is not None:
                 i = self.player.inventory
@@ -161,10 +165,10 @@ class ABCWeapon(Tool):
 
 class DetachableMagazineItem:
     def reserve(self):
-        return filter(
-            lambda o: isinstance(o, self.magazine_class),
-            self.player.inventory
-        )
+        return self.player.inventory.of(self.magazine_class)
+
+    def reserved(self):
+        return self.player.inventory.current(self.magazine_class)
 
     def restock(self):
         self.magazine = self.default_magazine()
@@ -185,11 +189,10 @@ class DetachableMagazineItem:
 
 class IntegralMagazineItem:
     def reserve(self):
-        return filter(
-            lambda o: isinstance(o, CartridgeBox) and
-                      isinstance(o.object, self.cartridge_class),
-            self.player.inventory
-        )
+        return self.player.inventory.of((CartridgeBox, self.cartridge_class))
+
+    def reserved(self):
+        return self.player.inventory.current((CartridgeBox, self.cartridge_class))
 
     def restock(self):
         self.magazine = self.default_magazine()
@@ -203,15 +206,19 @@ class IntegralMagazineItem:
         i.append(CartridgeBox(self.default_cartridge, self.default_reserve).mark_renewable())
 
 class RifleMagazine(BoxMagazine):
-    pass
+    __slots__ = ()
 
 class R762Magazine(RifleMagazine):
+    __slots__ = ()
+
     basemass  = 0.227
     basename  = "AA762R02"
     capacity  = 10
     cartridge = R762x54mm
 
 class HEIMagazine(RifleMagazine):
+    __slots__ = ()
+
     basemass  = 0.150
     basename  = "AA762HEI"
     capacity  = 5
@@ -227,9 +234,11 @@ class Rifle(DetachableMagazineItem):
     default_magazine_count = 5
 
 class SMGMagazine(BoxMagazine):
-    pass
+    __slots__ = ()
 
 class ParabellumMagazine(SMGMagazine):
+    __slots__ = ()
+
     basemass  = 0.160
     basename  = "MP5MAG30"
     capacity  = 30
@@ -245,6 +254,8 @@ class SMG(DetachableMagazineItem):
     default_magazine_count = 4
 
 class ShotgunMagazine(TubularMagazine):
+    __slots__ = ()
+
     capacity = 6
 
 class Shotgun(IntegralMagazineItem):
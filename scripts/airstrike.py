@@ -1,7 +1,6 @@
 from random import randint, random, uniform
 from dataclasses import dataclass
 from math import floor, inf
-from time import sleep
 
 from twisted.internet import reactor
 
@@ -34,19 +33,26 @@ AIRBOMB_GUARANTEED_KILL_RADIUS = 40
 AIRSTRIKE_PASSES        = 50
 AIRSTRIKE_CAST_DISTANCE = 300
 
+# Everything below runs in the reactor thread, since the block changes go to the journal
+# of the protocol (see `MilsimProtocol.flush_block_journal`), which is not thread-safe.
+
 def airbomb_explode(protocol, player_id, x, y, z):
     if player := protocol.take_player(player_id):
         explode(AIRBOMB_GUARANTEED_KILL_RADIUS, AIRBOMB_SAFE_DISTANCE, player, Vertex3(x, y, z))
+        airbomb_pass(protocol, player, x, y, AIRSTRIKE_PASSES)
+
+def airbomb_pass(protocol, player, x, y, npasses):
+    if npasses <= 0:
+        return
 
-        for i in range(AIRSTRIKE_PASSES):
-            X = x + randint(-AIRBOMB_RADIUS, AIRBOMB_RADIUS)
-            Y = y + randint(-AIRBOMB_RADIUS, AIRBOMB_RADIUS)
-            Z = protocol.map.get_z(X, Y)
+    X = x + randint(-AIRBOMB_RADIUS, AIRBOMB_RADIUS)
+    Y = y + randint(-AIRBOMB_RADIUS, AIRBOMB_RADIUS)
+    Z = protocol.map.get_z(X, Y)
 
-            player.grenade_destroy(X, Y, Z)
-            sendGrenadePacket(protocol, player.player_id, Vertex3(X, Y, Z), Vertex3(0, 0, 0), 0)
+    player.grenade_destroy(X, Y, Z)
+    sendGrenadePacket(protocol, player.player_id, Vertex3(X, Y, Z), Vertex3(0, 0, 0), 0)
 
-            sleep(uniform(0.0, 0.05))
+    reactor.callLater(uniform(0.0, 0.05), airbomb_pass, protocol, player, x, y, npasses - 1)
 
 def drop_airbomb(protocol, player_id, x, y):
     X = floor(x)
@@ -56,12 +62,16 @@ def drop_airbomb(protocol, player_id, x, y):
     airbomb_explode(protocol, player_id, X, Y, Z)
 
 def do_bombing(protocol, player_id, x, y, vx, vy, nbombs):
-    for k in range(nbombs):
-        sleep(BOMBING_DELAY)
-        drop_airbomb(protocol, player_id, x, y)
+    if nbombs > 0:
+        reactor.callLater(BOMBING_DELAY, bombing_run, protocol, player_id, x, y, vx, vy, nbombs)
+
+def bombing_run(protocol, player_id, x, y, vx, vy, nbombs):
+    drop_airbomb(protocol, player_id, x, y)
 
-        x += vx * BOMBING_DELAY
-        y += vy * BOMBING_DELAY
+    x += vx * BOMBING_DELAY
+    y += vy * BOMBING_DELAY
+
+    do_bombing(protocol, player_id, x, y, vx, vy, nbombs - 1)
 
 def do_airstrike(name, connection):
     protocol = connection.protocol
@@ -77,7 +87,7 @@ def do_airstrike(name, connection):
             o = wo.orientation
             v = Vertex3(o.x, o.y, 0).normal() * BOMBER_SPEED
 
-            reactor.callInThread(do_bombing, protocol, connection.player_id, x, y, v.x, v.y, BOMBS_COUNT)
+            do_bombing(protocol, connection.player_id, x, y, v.x, v.y, BOMBS_COUNT)
 
 @command(admin_only = True)
 @alive_only
@@ -105,6 +115,8 @@ def air(player, loc = None):
             o.report("Awaiting for coordinates")
 
 class Laser(UnderbarrelItem):
+    __slots__ = ('timer',)
+
     name = "Laser"
     mass = 0.500
 
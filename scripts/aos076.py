@@ -8,6 +8,9 @@ from pyspades import contained as loaders
 from pyspades.loaders import Loader
 from pyspades.common import encode
 
+from milsim.constants import MAP_CHUNK_SIZE
+from milsim.map import MapStreamReader
+
 def crc32(generator):
     size, crc, data = 0, 0, generator.get_data()
 
@@ -66,11 +69,15 @@ def wusync(conn):
 class MapStart:
     id = 18
 
-    def __init__(self, protocol):
+    def __init__(self, protocol, data):
         self.protocol = protocol
+        self.data     = data
 
     def write(self, writer):
-        size, crc = crc32(self.protocol.map.get_generator())
+        if isinstance(self.data, MapStreamReader):
+            size, crc = self.data.stream.size, self.data.stream.crc
+        else:
+            size, crc = crc32(self.protocol.map.get_generator())
 
         writer.writeByte(self.id, True)
         writer.writeInt(size, True, False)
@@ -115,7 +122,7 @@ def apply_script(protocol, connection, config):
         def send_map(self, data = None):
             if data is not None:
                 self.map_data = data
-                self.send_contained(MapStart(self.protocol))
+                self.send_contained(MapStart(self.protocol, data))
             elif self.map_data is None:
                 return
 
@@ -132,11 +139,11 @@ def apply_script(protocol, connection, config):
                 self.on_join()
                 return
 
-            for _ in range(10):
+            for _ in range(self.map_chunk_budget()):
                 if not self.map_data.data_left():
                     break
                 map_data = loaders.MapChunk()
-                map_data.data = self.map_data.read(8192)
+                map_data.data = self.map_data.read(MAP_CHUNK_SIZE)
                 self.send_contained(map_data)
 
         def set_location(self, location = None):
@@ -72,16 +72,59 @@ class Engine:
             return "Usage: /engine debug (on|off)"
 
     @staticmethod
-    def stats(protocol):
+    def stats(protocol, value = None):
         o = protocol.engine
 
-        return "Total: {total}, alive: {alive}, lag: {lag}, peak: {peak}, usage: {usage}".format(
-            total = o.total,
-            alive = o.alive,
-            lag   = formatMicroseconds(o.lag),
-            peak  = formatMicroseconds(o.peak),
-            usage = formatBytes(o.usage)
-        )
+        if value == 'reset':
+            o.reset_stats()
+            return "Stats are reset"
+        elif value is not None:
+            return "Usage: /engine stats [reset]"
+
+        s = o.stats; n = max(s.steps, 1)
+
+        buckets = ["<{}".format(formatMicroseconds(T)) for T in s.buckets] + ["more"]
+
+        return "\n".join((
+            "Total: {total}, alive: {alive}, lag: {lag}, peak: {peak}, usage: {usage}".format(
+                total = o.total,
+                alive = o.alive,
+                lag   = formatMicroseconds(o.lag),
+                peak  = formatMicroseconds(o.peak),
+                usage = formatBytes(o.usage)
+            ),
+            "Per step: {voxels:.1f} voxel(s), {penetrations:.1f} penetration(s), {ricochets:.1f} ricochet(s), {player_tests:.1f} player test(s), {callbacks:.1f} callback(s)".format(
+                voxels       = s.total.voxels / n,
+                penetrations = s.total.penetrations / n,
+                ricochets    = s.total.ricochets / n,
+                player_tests = s.total.player_tests / n,
+                callbacks    = s.total.callbacks / n
+            ),
+            "Time per step: physics {}, callbacks {}".format(
+                formatMicroseconds(s.total.physics_time / n),
+                formatMicroseconds(s.total.callback_time / n)
+            ),
+            "Steps: {}, {}".format(s.steps, ", ".join(
+                "{} {}".format(bucket, count) for bucket, count in zip(buckets, s.histogram) if count > 0
+            ) or "none")
+        ))
+
+    @staticmethod
+    def profile(protocol, value = None):
+        o = protocol.profiler
+
+        if value == 'reset':
+            o.reset()
+            return "Profile is reset"
+        elif value is not None:
+            return "Usage: /engine profile [reset]"
+
+        def line(phase, histogram):
+            p50, p99, pmax = map(lambda t: formatMicroseconds(t * 1e+6), histogram.summary())
+            return "{}: p50 {}, p99 {}, max {}".format(phase, p50, p99, pmax)
+
+        it = filter(lambda kv: len(kv[1]) > 0, o.items())
+        return "\n".join(line(phase, histogram) for phase, histogram in it) or "No samples"
 
     @staticmethod
     def flush(protocol):
@@ -306,16 +349,16 @@ items_per_page = 3
 
 def format_page(pagenum, i):
     it = islice(i, items_per_page * (pagenum - 1), items_per_page * pagenum)
-    return "{}) {}".format(pagenum, ", ".join(map(format_item, it)))
+    return "{}) {}".format(pagenum, ", ".join(format_item(o, n) for o, n in it))
 
 def query(target, i):
-    for k, o in enumerate(i):
+    for k, (o, n) in enumerate(i):
         if target.lower() in o.name.lower():
             return k // items_per_page + 1
 
 def available(player):
     for i in player.get_available_inventory():
-        yield from i
+        yield from i.listing()
 
 def scroll(player, argval = None, direction = 0):
     if argval is None:
@@ -357,9 +400,9 @@ def c_backpack(player, argval = None):
     elif argval.isdigit():
         page = int(argval)
     else:
-        page = query(argval, player.inventory)
+        page = query(argval, player.inventory.listing())
 
-    return format_page(page, player.inventory)
+    return format_page(page, player.inventory.listing())
 
 @command()
 @alive_only
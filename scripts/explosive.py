@@ -9,7 +9,7 @@ from milsim.common import (
     take_item, take_items, format_taken_items
 )
 from milsim.blast import sendGrenadePacket, explode
-from milsim.types import TileEntity, Item
+from milsim.types import TileEntity, ItemStack, Item
 
 class Explosive(TileEntity):
     r1, r2 = 7.0, 30.0
@@ -38,6 +38,8 @@ class Landmine(Explosive):
     Δz = -1
     z0 = -0.5
 
+    pressure_sensitive = True
+
     on_pressure  = Explosive.explode
     on_explosion = Explosive.explode
     on_destroy   = Explosive.explode
@@ -49,6 +51,8 @@ class Charge(Explosive):
     on_destroy   = Explosive.explode
 
 class ExplosiveItem(Item):
+    __slots__ = ()
+
     tile_entity_class = NotImplemented
 
     def apply(self, player):
@@ -71,6 +75,8 @@ class ExplosiveItem(Item):
         return "{} placed at ({}, {}, {})".format(self.name, x, y, z)
 
 class LandmineItem(ExplosiveItem):
+    __slots__ = ()
+
     tile_entity_class = Landmine
     name              = "Landmine"
     mass              = 0.550
@@ -88,6 +94,8 @@ class LandmineItem(ExplosiveItem):
         return ExplosiveItem.spawn(self, player, x, y, z)
 
 class DetonatorItem(Item):
+    __slots__ = ('targets',)
+
     mass  = 0.150
     limit = 4
 
@@ -116,6 +124,8 @@ class DetonatorItem(Item):
         self.targets = []
 
 class ChargeItem(ExplosiveItem):
+    __slots__ = ()
+
     tile_entity_class = Charge
     name              = "Charge"
     mass              = 0.700
@@ -124,10 +134,7 @@ class ChargeItem(ExplosiveItem):
         if player.protocol.get_tile_entity(x, y, z) is not None:
             return "{} cannot be placed here".format(self.name)
 
-        it = filter(
-            lambda o: isinstance(o, DetonatorItem) and o.available(),
-            player.inventory
-        )
+        it = filter(lambda o: o.available(), player.inventory.of(DetonatorItem))
 
         if o := next(it, None):
             o.add(x, y, z)
@@ -184,11 +191,9 @@ def apply_script(protocol, connection, config):
     def explosive_default_tent_loadout(self):
         yield from protocol.default_tent_loadout(self)
 
-        for k in range(100):
-            yield LandmineItem()
-            yield DetonatorItem()
-            yield ChargeItem()
-            yield ChargeItem()
+        yield ItemStack(100, LandmineItem)
+        yield ItemStack(100, DetonatorItem)
+        yield ItemStack(200, ChargeItem)
 
     def explosive_default_loadout(self):
         yield from connection.default_loadout(self)
@@ -9,6 +9,8 @@ from piqueserver.config import config
 from pyspades import contained as loaders
 from pyspades.constants import *
 
+from milsim.constants import ENET_PEER_PACKET_LOSS_SCALE
+
 def take(iterator, n, default = None):
     return next(islice(iterator, max(0, n - 1), None), default)
 
@@ -89,8 +91,6 @@ def c_ping(connection, nickname = None):
     player = connection if nickname is None else get_player(connection.protocol, nickname)
 
     if peer := getattr(player, 'peer', None):
-        ENET_PEER_PACKET_LOSS_SCALE = (1 << 16) # TODO: should be moved to `enet`
-
         return "{nickname}: average = {average} ms, minimum = {minimum} ms, variance = {variance} ms, packet loss = {loss:.2f} %".format(
             nickname = player.name,
             average  = peer.roundTripTime,
@@ -1,4 +1,5 @@
 #include <Milsim/Engine.hxx>
+#include <Milsim/Raycast.hxx>
 
 template<typename T> Vector3<T> cone(const Vector3<T> & v, const T σ) {
     static std::random_device rd;
@@ -34,6 +35,81 @@ Voxel & VoxelData::get(int x, int y, int z) {
 
 uint64_t Object::gidx = 0;
 
+// Returns whether the voxel should be destroyed, the caller is responsible for that.
+bool Engine::smash(int x, int y, int z, double ΔE) {
+    if (indestructible(x, y, z)) return false;
+
+    auto & voxel = vxlData.get(x, y, z);
+    auto M = voxel.material();
+
+    if (M->crumbly && randbool<double>(0.5) && unstable(x, y, z))
+        return true;
+
+    return voxel.isub(ΔE * (M->durability / M->absorption));
+}
+
+void Engine::smash(int player_id, const std::vector<Vector3i> & cells, double ΔE) {
+    PyOwnedRef blocks(PyList_New(0)); RETIFZ(blocks);
+
+    // `unstable` only looks below the voxel, so as long as `cells` go from top to bottom
+    // postponing the destruction until the end gives the same result as doing it in place.
+    for (auto & v : cells) {
+        if (!smash(v.x, v.y, v.z, ΔE)) continue;
+
+        PyList_Append(blocks, PyTuple(v.x, v.y, v.z));
+    }
+
+    if (PyList_GET_SIZE(static_cast<PyObject *>(blocks)) > 0)
+        onDestroyMany(player_id, static_cast<PyObject *>(blocks));
+}
+
+std::vector<Vector3i> cube(const Vector3i & v, int radius) {
+    std::vector<Vector3i> retval;
+
+    for (int x = v.x - radius; x <= v.x + radius; x++)
+        for (int y = v.y - radius; y <= v.y + radius; y++)
+            for (int z = v.z - radius; z <= v.z + radius; z++)
+                retval.emplace_back(x, y, z);
+
+    return retval;
+}
+
+inline double falloff(double d, double inner, double outer) {
+    if (d >= outer) return 0;
+    if (d <= inner) return 100;
+
+    return 100 * std::sqrt((outer - d) / (outer - inner));
+}
+
+std::vector<std::pair<int, double>> Engine::blast(const Vector3d & r, double inner, double outer) {
+    std::vector<std::pair<int, double>> retval;
+
+    std::vector<size_t> candidates; std::vector<float> targets;
+
+    for (size_t i = 0; i < players.size(); i++) {
+        if (!players[i].valid()) continue;
+
+        auto p = players[i].position();
+        if ((p - r).abs() >= outer) continue;
+
+        candidates.push_back(i);
+        targets.insert(targets.end(), {float(p.x), float(p.y), float(std::min(62.9, p.z))});
+    }
+
+    std::vector<uint8_t> mask(candidates.size());
+
+    canSeeMany(map, r.x, r.y, std::min(62.9, r.z), targets.data(), candidates.size(), outer, mask.data());
+
+    for (size_t k = 0; k < candidates.size(); k++) {
+        if (!mask[k]) continue;
+
+        auto i = candidates[k];
+        retval.emplace_back(i, falloff((players[i].position() - r).abs(), inner, outer));
+    }
+
+    return retval;
+}
+
 void Engine::clear() {
     temperature = 0;
     pressure    = 101325;
@@ -49,6 +125,7 @@ void Engine::clear() {
     Object::flush();
 
     vxlData.clear();
+    pressureVoxels.clear();
 }
 
 void Engine::update() {
@@ -99,6 +176,8 @@ void Engine::update() {
 void Engine::step(const double t1, const double t2) {
     using namespace std::chrono;
 
+    stats.last = Counters();
+
     const auto T1 = steady_clock::now();
 
     for (auto it = objects.begin(); it != objects.end(); next(t1, t2, it));
@@ -108,6 +187,42 @@ void Engine::step(const double t1, const double t2) {
     auto diff = duration_cast<microseconds>(T2 - T1).count();
     _lag  = (_lag + diff) / 2;
     _peak = std::max(_peak, double(diff));
+
+    auto T = duration<double, std::micro>(T2 - T1).count();
+    stats.last.physicsTime = T - stats.last.callbackTime;
+    stats.add(T);
+}
+
+void Engine::reset() {
+    stats.reset(); _peak = 0.0;
+}
+
+void Engine::sweep() {
+    std::vector<std::pair<int, Vector3i>> triggers;
+
+    for (int i = 0; i < int(players.size()); i++) {
+        auto & player = players[i];
+
+        if (!player.valid()) continue;
+
+        auto r1 = player.tracked ? player.last : player.floor(), r2 = player.floor();
+
+        player.last = r2; player.tracked = true;
+
+        if (pressureVoxels.empty()) continue;
+
+        cubeLine(r1.x, r1.y, r1.z, r2.x, r2.y, r2.z, [&](long x, long y, long z) {
+            if (pressureVoxels.contains(get_pos(x, y, z)) && get_solid(x, y, z, map))
+                triggers.emplace_back(i, Vector3i(x, y, z));
+        });
+    }
+
+    // Callbacks are made afterwards, since they may change both `players` and `pressureVoxels`.
+    for (auto & [i, v] : triggers) {
+        if (!pressureVoxels.contains(get_pos(v.x, v.y, v.z))) continue;
+
+        onPressure(i, v.x, v.y, v.z); RETIFERR();
+    }
 }
 
 void Engine::next(double t1, const double t2, ObjectIterator & it) {
@@ -123,7 +238,7 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
     bool stuck = false;
 
     while (t1 < t2 && N < 10000 && !stuck) {
-        N++;
+        N++; stats.last.voxels++;
 
         int64_t X = std::floor(r.x), Y = std::floor(r.y), Z = std::ceil(r.z);
 
@@ -144,18 +259,18 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
             if (state != Terminal::flying) {
                 constexpr double hitEffectThresholdEnergy = 5.0;
 
-                trace(o.index(), r, v.abs() / o.v0(), false);
+                call(onTrace, o.index(), r.x, r.y, r.z, v.abs() / o.v0(), false);
 
                 if (hitEffectThresholdEnergy <= o.energy())
-                    stuck = Py_True == onBlockHit(
+                    stuck = Py_True == call(onBlockHit,
                         o.object(), r.x, r.y, r.z, v.x, v.y, v.z, X, Y, Z,
                         o.thrower(), o.energy(), o.area
                     );
             }
 
-            if (state == Terminal::ricochet) v -= n * (2 * (v, n));
+            if (state == Terminal::ricochet) { v -= n * (2 * (v, n)); stats.last.ricochets++; }
 
-            if (state == Terminal::penetration) v = cone(v, 0.05);
+            if (state == Terminal::penetration) { v = cone(v, 0.05); stats.last.penetrations++; }
         }
 
         // `dr` depends only on direction, not the absolute value of `v`
@@ -204,7 +319,7 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
             }
 
             if (voxel->isub(ΔE * (M->durability / M->absorption)))
-                onDestroy(o.thrower(), X, Y, Z);
+                call(onDestroy, o.thrower(), X, Y, Z);
         }
 
         Ray<double> ray(r, dr); Arc<double> arc{}; int target = -1;
@@ -213,19 +328,19 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
             auto & player = players[i];
             if (!player.valid()) continue;
 
-            auto retval = player.intersect(ray);
+            auto retval = player.intersect(ray); stats.last.playerTests++;
             if (retval < arc) { arc = retval; target = i; }
         }
 
         if (0 <= target) {
             auto w = arc.begin(ray);
 
-            stuck = Py_True == onPlayerHit(
+            stuck = Py_True == call(onPlayerHit,
                 o.object(), w.x, w.y, w.z, v.x, v.y, v.z, X, Y, Z,
                 o.thrower(), o.energy(), o.area, target, arc.index
             );
 
-            trace(o.index(), w, v.abs() / o.v0(), false);
+            call(onTrace, o.index(), w.x, w.y, w.z, v.abs() / o.v0(), false);
         }
 
         auto m  = o.mass;
@@ -240,7 +355,7 @@ void Engine::next(double t1, const double t2, ObjectIterator & it) {
 
     o.position.set(r); o.velocity.set(v);
 
-    if (!stuck) trace(o.index(), r, v.abs() / o.v0(), false);
+    if (!stuck) call(onTrace, o.index(), r.x, r.y, r.z, v.abs() / o.v0(), false);
 
     //if (t2 - o.timestamp() > 10) printf("%ld: time out\n", o.index());
     //if (o.velocity.abs() <= 1e-3) printf("%ld: speed too low (%f m/s)\n", o.index(), o.velocity.abs());
@@ -51,9 +51,11 @@ static int PyEngineInit(PyEngine * self, PyObject * w, PyObject * kw) {
 
     RETERRIFZ(self->ref = new Engine(o));
 
-    RETERRIFZ(self->ref->onPlayerHit = PyOwnedRef(o, "onPlayerHit"));
-    RETERRIFZ(self->ref->onBlockHit  = PyOwnedRef(o, "onBlockHit"));
-    RETERRIFZ(self->ref->onDestroy   = PyOwnedRef(o, "onDestroy"));
+    RETERRIFZ(self->ref->onPlayerHit   = PyOwnedRef(o, "onPlayerHit"));
+    RETERRIFZ(self->ref->onBlockHit    = PyOwnedRef(o, "onBlockHit"));
+    RETERRIFZ(self->ref->onDestroy     = PyOwnedRef(o, "onDestroy"));
+    RETERRIFZ(self->ref->onDestroyMany = PyOwnedRef(o, "onDestroyMany"));
+    RETERRIFZ(self->ref->onPressure    = PyOwnedRef(o, "onPressure"));
 
     return 0;
 }
@@ -70,6 +72,8 @@ static int PyEngineClear(PyEngine * self) {
     self->ref->onBlockHit.retain(nullptr);
     self->ref->onPlayerHit.retain(nullptr);
     self->ref->onDestroy.retain(nullptr);
+    self->ref->onDestroyMany.retain(nullptr);
+    self->ref->onPressure.retain(nullptr);
 
     return 0;
 }
@@ -98,6 +102,12 @@ static int PyEngineTraverse(PyEngine * self, visitproc visit, void * arg) {
     if (self->ref->onDestroy != nullptr)
         Py_VISIT(self->ref->onDestroy);
 
+    if (self->ref->onDestroyMany != nullptr)
+        Py_VISIT(self->ref->onDestroyMany);
+
+    if (self->ref->onPressure != nullptr)
+        Py_VISIT(self->ref->onPressure);
+
     return 0;
 }
 
@@ -190,6 +200,34 @@ static PyObject * PyEngineStep(PyEngine * self, PyObject * w) {
     Py_RETURN_NONE;
 }
 
+static PyObject * PyEngineSweep(PyEngine * self, PyObject *) {
+    self->ref->sweep(); RETZIFERR();
+
+    Py_RETURN_NONE;
+}
+
+static PyObject * PyEngineAddPressure(PyEngine * self, PyObject * w) {
+    int x, y, z;
+
+    if (!PyArg_ParseTuple(w, "iii", &x, &y, &z))
+        return nullptr;
+
+    self->ref->pressureVoxels.insert(get_pos(x, y, z));
+
+    Py_RETURN_NONE;
+}
+
+static PyObject * PyEngineRemovePressure(PyEngine * self, PyObject * w) {
+    int x, y, z;
+
+    if (!PyArg_ParseTuple(w, "iii", &x, &y, &z))
+        return nullptr;
+
+    self->ref->pressureVoxels.erase(get_pos(x, y, z));
+
+    Py_RETURN_NONE;
+}
+
 static PyObject * PyEngineGetitem(PyEngine * self, PyObject * k) {
     int x, y, z;
 
@@ -264,23 +302,69 @@ static PyObject * PyEngineSmash(PyEngine * self, PyObject * w) {
     if (!PyArg_ParseTuple(w, "iiiid", &player_id, &x, &y, &z, &ΔE))
         return nullptr;
 
-    if (self->ref->indestructible(x, y, z))
-        Py_RETURN_NONE;
+    if (self->ref->smash(x, y, z, ΔE))
+        self->ref->onDestroy(player_id, x, y, z);
 
-    auto & voxel = self->ref->vxlData.get(x, y, z);
-    auto M = voxel.material();
+    Py_RETURN_NONE;
+}
 
-    if (M->crumbly && randbool<double>(0.5) && self->ref->unstable(x, y, z)) {
-        self->ref->onDestroy(player_id, x, y, z);
-        Py_RETURN_NONE;
+static PyObject * PyEngineSmashRegion(PyEngine * self, PyObject * w) {
+    int player_id; PyObject * co, * ro; double ΔE;
+
+    if (!PyArg_ParseTuple(w, "iOOd", &player_id, &co, &ro, &ΔE))
+        return nullptr;
+
+    auto r = PyDecode<Vector3d>(co); RETZIFERR();
+
+    Vector3i c(std::floor(r.x), std::floor(r.y), std::floor(r.z)); std::vector<Vector3i> cells;
+
+    if (PyLong_Check(ro)) {
+        auto radius = PyDecode<int>(ro); RETZIFERR();
+
+        cells = cube(c, radius);
+    } else {
+        PyOwnedRef iter(PyObject_GetIter(ro)); RETZIFZ(iter);
+
+        while (auto item = PyIter_Next(iter)) {
+            int dx, dy, dz; auto ok = PyArg_ParseTuple(PyOwnedRef(item), "iii", &dx, &dy, &dz);
+            if (!ok) return nullptr;
+
+            cells.emplace_back(c.x + dx, c.y + dy, c.z + dz);
+        }
+
+        RETZIFERR();
     }
 
-    if (voxel.isub(ΔE * (M->durability / M->absorption)))
-        self->ref->onDestroy(player_id, x, y, z);
+    self->ref->smash(player_id, cells, ΔE); RETZIFERR();
 
     Py_RETURN_NONE;
 }
 
+static PyObject * PyEngineBlast(PyEngine * self, PyObject * w) {
+    PyObject * ro; double inner, outer;
+
+    if (!PyArg_ParseTuple(w, "Odd", &ro, &inner, &outer))
+        return nullptr;
+
+    auto r = PyDecode<Vector3d>(ro); RETZIFERR();
+
+    auto hits = self->ref->blast(r, inner, outer); RETZIFERR();
+
+    auto retval = PyList_New(hits.size()); RETZIFZ(retval);
+
+    for (size_t k = 0; k < hits.size(); k++) {
+        auto [i, D] = hits[k];
+
+        auto t = PyTuple_New(2);
+        PyTuple_SET_ITEM(t, 0, PyEncode<int>(i));
+        PyTuple_SET_ITEM(t, 1, PyEncode<double>(D));
+
+        PyList_SET_ITEM(retval, k, t);
+    }
+
+    return retval;
+}
+
 static PyObject * PyEngineApply(PyEngine * self, PyObject * dict) {
     if (!PyDict_Check(dict)) {
         PyErr_SetString(PyExc_TypeError, "must be dict");
@@ -320,6 +404,7 @@ static PyObject * PyEngineOnSpawn(PyEngine * self, PyObject * w) {
     player.set_position(p);
     player.set_orientation(f);
     player.set_crouch(co == Py_True);
+    player.tracked = false;
 
     Py_RETURN_NONE;
 }
@@ -354,6 +439,89 @@ static PyObject * PyEngineSetAnimation(PyEngine * self, PyObject * w) {
     Py_RETURN_NONE;
 }
 
+static PyStructSequence_Field PyCountersFields[] = {
+    {"voxels",        "Voxels traversed"},
+    {"penetrations",  "Voxels penetrated"},
+    {"ricochets",     "Ricochets off voxels"},
+    {"player_tests",  "Ray-player intersection tests"},
+    {"callbacks",     "Python callbacks called"},
+    {"callback_time", "Time spent in Python callbacks (μs)"},
+    {"physics_time",  "Time spent outside of Python callbacks (μs)"},
+    {NULL}
+};
+
+static PyStructSequence_Desc PyCountersDesc = {
+    .name          = "milsim.engine.Counters",
+    .doc           = "Work done by `Engine.step`",
+    .fields        = PyCountersFields,
+    .n_in_sequence = 7,
+};
+
+static PyStructSequence_Field PyStatsFields[] = {
+    {"steps",     "Number of steps"},
+    {"buckets",   "Upper bounds of the step time histogram buckets (μs), the last one is unbounded"},
+    {"histogram", "Number of steps in each bucket"},
+    {"last",      "Counters of the last step"},
+    {"total",     "Counters of all steps"},
+    {NULL}
+};
+
+static PyStructSequence_Desc PyStatsDesc = {
+    .name          = "milsim.engine.Stats",
+    .doc           = "Statistics of `Engine.step` since the last `Engine.reset_stats`",
+    .fields        = PyStatsFields,
+    .n_in_sequence = 5,
+};
+
+static PyTypeObject PyCountersType, PyStatsType;
+
+template<typename T, size_t N> static PyObject * PyEncodeArray(const std::array<T, N> & xs) {
+    auto retval = PyTuple_New(N); RETZIFZ(retval);
+
+    for (size_t i = 0; i < N; i++)
+        PyTuple_SET_ITEM(retval, i, PyEncode<T>(xs[i]));
+
+    return retval;
+}
+
+static PyObject * PyEncodeCounters(const Counters & o) {
+    auto retval = PyStructSequence_New(&PyCountersType); RETZIFZ(retval);
+
+    PyStructSequence_SET_ITEM(retval, 0, PyEncode<uint64_t>(o.voxels));
+    PyStructSequence_SET_ITEM(retval, 1, PyEncode<uint64_t>(o.penetrations));
+    PyStructSequence_SET_ITEM(retval, 2, PyEncode<uint64_t>(o.ricochets));
+    PyStructSequence_SET_ITEM(retval, 3, PyEncode<uint64_t>(o.playerTests));
+    PyStructSequence_SET_ITEM(retval, 4, PyEncode<uint64_t>(o.callbacks));
+    PyStructSequence_SET_ITEM(retval, 5, PyEncode<double>(o.callbackTime));
+    PyStructSequence_SET_ITEM(retval, 6, PyEncode<double>(o.physicsTime));
+
+    return retval;
+}
+
+static PyObject * PyEngineStats(PyEngine * self, void *) {
+    auto & o = self->ref->stats;
+
+    auto retval = PyStructSequence_New(&PyStatsType); RETZIFZ(retval);
+
+    PyStructSequence_SET_ITEM(retval, 0, PyEncode<uint64_t>(o.steps));
+    PyStructSequence_SET_ITEM(retval, 1, PyEncodeArray(Stats::bounds));
+    PyStructSequence_SET_ITEM(retval, 2, PyEncodeArray(o.histogram));
+    PyStructSequence_SET_ITEM(retval, 3, PyEncodeCounters(o.last));
+    PyStructSequence_SET_ITEM(retval, 4, PyEncodeCounters(o.total));
+
+    for (Py_ssize_t i = 0; i < PyStatsDesc.n_in_sequence; i++)
+        if (PyStructSequence_GET_ITEM(retval, i) == nullptr)
+        { Py_DECREF(retval); return nullptr; }
+
+    return retval;
+}
+
+static PyObject * PyEngineResetStats(PyEngine * self, PyObject *) {
+    self->ref->reset();
+
+    Py_RETURN_NONE;
+}
+
 static PyObject * PyEngineGetOnTrace(PyEngine * self, void *) {
     auto newref = self->ref->onTrace.incref();
     return newref == nullptr ? Py_NewRef(Py_None) : newref;
@@ -400,23 +568,30 @@ static PyMappingMethods PyEngineMapping = {
 };
 
 static PyMethodDef PyEngineMethods[] = {
-    {"step",          PyCFunction(PyEngineStep),         METH_VARARGS, NULL},
-    {"add",           PyCFunction(PyEngineAdd),          METH_VARARGS, NULL},
-    {"update",        PyCFunction(PyEngineUpdate),       METH_O,       NULL},
-    {"dig",           PyCFunction(PyEngineDig),          METH_VARARGS, NULL},
-    {"smash",         PyCFunction(PyEngineSmash),        METH_VARARGS, NULL},
-    {"apply",         PyCFunction(PyEngineApply),        METH_O,       NULL},
-    {"clear",         PyCFunction(PyEngineClearMeth),    METH_NOARGS,  NULL},
-    {"flush",         PyCFunction(PyEngineFlush),        METH_NOARGS,  NULL},
-    {"on_spawn",      PyCFunction(PyEngineOnSpawn),      METH_VARARGS, NULL},
-    {"on_despawn",    PyCFunction(PyEngineOnDespawn),    METH_VARARGS, NULL},
-    {"set_animation", PyCFunction(PyEngineSetAnimation), METH_VARARGS, NULL},
-    {NULL                                                                  }
+    {"step",            PyCFunction(PyEngineStep),           METH_VARARGS, NULL},
+    {"add",             PyCFunction(PyEngineAdd),            METH_VARARGS, NULL},
+    {"update",          PyCFunction(PyEngineUpdate),         METH_O,       NULL},
+    {"dig",             PyCFunction(PyEngineDig),            METH_VARARGS, NULL},
+    {"smash",           PyCFunction(PyEngineSmash),          METH_VARARGS, NULL},
+    {"smash_region",    PyCFunction(PyEngineSmashRegion),    METH_VARARGS, NULL},
+    {"blast",           PyCFunction(PyEngineBlast),          METH_VARARGS, NULL},
+    {"apply",           PyCFunction(PyEngineApply),          METH_O,       NULL},
+    {"clear",           PyCFunction(PyEngineClearMeth),      METH_NOARGS,  NULL},
+    {"flush",           PyCFunction(PyEngineFlush),          METH_NOARGS,  NULL},
+    {"on_spawn",        PyCFunction(PyEngineOnSpawn),        METH_VARARGS, NULL},
+    {"on_despawn",      PyCFunction(PyEngineOnDespawn),      METH_VARARGS, NULL},
+    {"set_animation",   PyCFunction(PyEngineSetAnimation),   METH_VARARGS, NULL},
+    {"sweep",           PyCFunction(PyEngineSweep),          METH_NOARGS,  NULL},
+    {"add_pressure",    PyCFunction(PyEngineAddPressure),    METH_VARARGS, NULL},
+    {"remove_pressure", PyCFunction(PyEngineRemovePressure), METH_VARARGS, NULL},
+    {"reset_stats",     PyCFunction(PyEngineResetStats),     METH_NOARGS,  NULL},
+    {NULL                                                                    }
 };
 
 static PyGetSetDef PyEngineGetset[] = {
     {"lag",         getter(PyEngineLag),         nullptr,                    "Average time elapsed in `Engine.step` (μs)", NULL},
     {"peak",        getter(PyEnginePeak),        nullptr,                    "Peak time elapsed in `Engine.lag` (μs)",     NULL},
+    {"stats",       getter(PyEngineStats),       nullptr,                    "Statistics of `Engine.step`",                NULL},
     {"alive",       getter(PyEngineAlive),       nullptr,                    "Number of alive objects",                    NULL},
     {"total",       getter(PyEngineTotal),       nullptr,                    "Total number of registered objects",         NULL},
     {"usage",       getter(PyEngineUsage),       nullptr,                    "Approximate memory usage (byte)",            NULL},
@@ -451,4 +626,7 @@ PyTypeObject PyEngineType = {
 
 void PyEngineReady() {
     PyType_Ready(&PyEngineType);
+
+    PyStructSequence_InitType2(&PyCountersType, &PyCountersDesc);
+    PyStructSequence_InitType2(&PyStatsType, &PyStatsDesc);
 }
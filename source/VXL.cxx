@@ -3,6 +3,9 @@
 // https://github.com/piqueserver/piqueserver/blob/master/pyspades/vxl_c.cpp
 #include <unordered_set>
 
+#include <algorithm>
+#include <cstring>
+#include <thread>
 #include <mutex>
 #include <queue>
 
@@ -83,3 +86,284 @@ int traverseNode(int x, int y, int z, MapData * M, int destroy) {
 
     return amount;
 }
+
+// https://prng.di.unimi.it/splitmix64.c
+inline uint64_t splitmix64(uint64_t x) {
+    x += 0x9E3779B97F4A7C15;
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9;
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB;
+    return x ^ (x >> 31);
+}
+
+int Brush::color(int x, int y, int z) const {
+    if (jitter <= 0) return makeColor(r, g, b);
+
+    auto h = splitmix64(seed ^ get_pos(x, y, z)); int d = 2 * jitter + 1;
+
+    auto shift = [&](int c) {
+        c += int(h % d) - jitter; h /= d;
+        return std::clamp(c, 0, 255);
+    };
+
+    int R = shift(r), G = shift(g), B = shift(b);
+    return makeColor(R, G, B);
+}
+
+// Sorts the bounds and clips them to the map, returns `false` if nothing is left.
+inline bool clip(int & x1, int & y1, int & z1, int & x2, int & y2, int & z2) {
+    if (x2 < x1) std::swap(x1, x2);
+    if (y2 < y1) std::swap(y1, y2);
+    if (z2 < z1) std::swap(z1, z2);
+
+    x1 = std::max(x1, 0); x2 = std::min(x2, 511);
+    y1 = std::max(y1, 0); y2 = std::min(y2, 511);
+    z1 = std::max(z1, 0); z2 = std::min(z2, 63);
+
+    return x1 <= x2 && y1 <= y2 && z1 <= z2;
+}
+
+void fillBox(MapData * M, const Brush & brush, int x1, int y1, int z1, int x2, int y2, int z2) {
+    if (!clip(x1, y1, z1, x2, y2, z2)) return;
+
+    M->colors.reserve(M->colors.size() + size_t(x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1));
+
+    for (int z = z1; z <= z2; z++)
+        for (int y = y1; y <= y2; y++)
+            for (int x = x1; x <= x2; x++)
+                set_point(x, y, z, M, true, brush.color(x, y, z));
+}
+
+void hollowBox(MapData * M, const Brush & brush, int x1, int y1, int z1, int x2, int y2, int z2) {
+    if (x2 < x1) std::swap(x1, x2);
+    if (y2 < y1) std::swap(y1, y2);
+    if (z2 < z1) std::swap(z1, z2);
+
+    fillBox(M, brush, x1, y1, z1, x2, y1, z2);
+    fillBox(M, brush, x1, y2, z1, x2, y2, z2);
+    fillBox(M, brush, x1, y1, z1, x1, y2, z2);
+    fillBox(M, brush, x2, y1, z1, x2, y2, z2);
+    fillBox(M, brush, x1, y1, z1, x2, y2, z1);
+    fillBox(M, brush, x1, y1, z2, x2, y2, z2);
+}
+
+void clearBox(MapData * M, int x1, int y1, int z1, int x2, int y2, int z2) {
+    if (!clip(x1, y1, z1, x2, y2, z2)) return;
+
+    for (int z = z1; z <= z2; z++)
+        for (int y = y1; y <= y2; y++)
+            for (int x = x1; x <= x2; x++)
+                set_point(x, y, z, M, false, 0);
+}
+
+// https://www.geeksforgeeks.org/bresenhams-algorithm-for-3-d-line-drawing/
+void drawLine(MapData * M, const Brush & brush, int x1, int y1, int z1, int x2, int y2, int z2) {
+    auto plot = [&](int x, int y, int z) {
+        if (is_valid_position(x, y, z))
+            set_point(x, y, z, M, true, brush.color(x, y, z));
+    };
+
+    int dx = std::abs(x2 - x1), dy = std::abs(y2 - y1), dz = std::abs(z2 - z1);
+    int sx = x2 > x1 ? 1 : -1, sy = y2 > y1 ? 1 : -1, sz = z2 > z1 ? 1 : -1;
+
+    plot(x1, y1, z1);
+
+    if (dx >= dy && dx >= dz) {
+        int p1 = 2 * dy - dx, p2 = 2 * dz - dx;
+
+        while (x1 != x2) {
+            x1 += sx;
+            if (p1 >= 0) { y1 += sy; p1 -= 2 * dx; }
+            if (p2 >= 0) { z1 += sz; p2 -= 2 * dx; }
+            p1 += 2 * dy; p2 += 2 * dz;
+            plot(x1, y1, z1);
+        }
+    } else if (dy >= dx && dy >= dz) {
+        int p1 = 2 * dx - dy, p2 = 2 * dz - dy;
+
+        while (y1 != y2) {
+            y1 += sy;
+            if (p1 >= 0) { x1 += sx; p1 -= 2 * dy; }
+            if (p2 >= 0) { z1 += sz; p2 -= 2 * dy; }
+            p1 += 2 * dx; p2 += 2 * dz;
+            plot(x1, y1, z1);
+        }
+    } else {
+        int p1 = 2 * dy - dz, p2 = 2 * dx - dz;
+
+        while (z1 != z2) {
+            z1 += sz;
+            if (p1 >= 0) { y1 += sy; p1 -= 2 * dz; }
+            if (p2 >= 0) { x1 += sx; p2 -= 2 * dz; }
+            p1 += 2 * dy; p2 += 2 * dx;
+            plot(x1, y1, z1);
+        }
+    }
+}
+
+void copyRegion(MapData * dest, const MapData * src, int x1, int y1, int z1, int x2, int y2, int z2, int x, int y, int z) {
+    if (!clip(x1, y1, z1, x2, y2, z2)) return;
+
+    struct Cell { bool solid, colored; int color; };
+
+    // The regions may overlap when `dest == src`, so the source is read completely first.
+    std::vector<Cell> buffer;
+    buffer.reserve(size_t(x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1));
+
+    for (int Z = z1; Z <= z2; Z++)
+        for (int Y = y1; Y <= y2; Y++)
+            for (int X = x1; X <= x2; X++) {
+                int i = get_pos(X, Y, Z); auto iter = src->colors.find(i);
+
+                if (iter == src->colors.end())
+                    buffer.push_back({src->geometry[i], false, 0});
+                else
+                    buffer.push_back({src->geometry[i], true, iter->second});
+            }
+
+    auto cell = buffer.begin();
+
+    for (int Z = z1; Z <= z2; Z++)
+        for (int Y = y1; Y <= y2; Y++)
+            for (int X = x1; X <= x2; X++, cell++) {
+                int u = x + X - x1, v = y + Y - y1, w = z + Z - z1;
+                if (!is_valid_position(u, v, w)) continue;
+
+                int j = get_pos(u, v, w);
+                dest->geometry[j] = cell->solid;
+
+                if (cell->solid && cell->colored)
+                    dest->colors[j] = cell->color;
+                else
+                    dest->colors.erase(j);
+            }
+}
+
+void unpackMap(const MapData * M, uint8_t * solid, uint32_t * colors) {
+    constexpr size_t N = MAP_X * MAP_Y * MAP_Z;
+
+    for (size_t i = 0; i < N; i++)
+        solid[i] = M->geometry[i];
+
+    std::fill(colors, colors + N, 0);
+
+    for (auto & [i, color] : M->colors)
+        colors[i] = color;
+}
+
+void packMap(MapData * M, const uint8_t * solid, const uint32_t * colors) {
+    constexpr size_t N = MAP_X * MAP_Y * MAP_Z;
+
+    M->geometry.reset();
+    M->colors.clear();
+
+    for (size_t i = 0; i < N; i++) {
+        if (!solid[i]) continue;
+
+        M->geometry[i] = true;
+        if (colors[i] != 0) M->colors[i] = colors[i];
+    }
+}
+
+// Same as `load_vxl` in pyspades/vxl_c.cpp, but with bounds checking.
+// https://silverspaceship.com/aosmap/aos_file_format.html
+bool loadMap(MapData * M, const uint8_t * data, size_t size) {
+    constexpr size_t columns = MAP_X * MAP_Y;
+
+    // Spans have to be walked serially to find where each column starts, this is cheap compared to decoding.
+    std::vector<size_t> offsets(columns + 1);
+
+    size_t k = 0;
+
+    for (size_t i = 0; i < columns; i++) {
+        offsets[i] = k;
+
+        for (;;) {
+            if (k + 4 > size) return false;
+
+            auto span = data + k;
+
+            if (span[2] >= MAP_Z || span[1] > span[2] + 1) return false;
+            if (span[0] != 0 && span[0] < span[2] - span[1] + 2) return false;
+
+            if (span[0] == 0) { k += 4 * (span[2] - span[1] + 2); break; }
+
+            k += 4 * span[0];
+        }
+
+        if (k > size) return false;
+    }
+
+    offsets[columns] = k;
+
+    // Rows of different threads never share a word of the bitset, while colours are collected
+    // separately and inserted afterwards, since `std::unordered_map` is not thread-safe.
+    auto decode = [&](int y₁, int y₂, std::vector<std::pair<int, int>> & colors) {
+        for (int y = y₁; y < y₂; y++) for (int x = 0; x < MAP_X; x++) {
+            auto v = data + offsets[x + y * MAP_X];
+
+            for (int z = 0; z < MAP_Z; z++)
+                M->geometry[get_pos(x, y, z)] = true;
+
+            for (int z = 0;;) {
+                int top₁ = v[1], top₂ = v[2], N = v[0];
+
+                for (; z < top₁; z++)
+                    M->geometry[get_pos(x, y, z)] = false;
+
+                uint32_t color;
+                auto src = v + 4;
+
+                for (z = top₁; z <= top₂; z++, src += 4) {
+                    std::memcpy(&color, src, 4);
+                    colors.emplace_back(get_pos(x, y, z), color);
+                }
+
+                if (N == 0) break;
+
+                int bottomLength = N - 1 - (top₂ - top₁ + 1);
+
+                v += 4 * N;
+
+                int bottom₂ = v[3], bottom₁ = bottom₂ - bottomLength;
+
+                for (z = bottom₁; z < bottom₂; z++, src += 4) {
+                    if (z < 0 || z >= MAP_Z) continue;
+
+                    std::memcpy(&color, src, 4);
+                    colors.emplace_back(get_pos(x, y, z), color);
+                }
+
+                z = bottom₂;
+            }
+        }
+    };
+
+    int N = std::clamp<int>(std::thread::hardware_concurrency(), 1, 8);
+
+    std::vector<std::vector<std::pair<int, int>>> colors(N);
+    std::vector<std::thread> workers; workers.reserve(N - 1);
+
+    int chunk = (MAP_Y + N - 1) / N;
+
+    for (int k = 1; k < N; k++)
+        workers.emplace_back(decode, k * chunk, std::min(MAP_Y, (k + 1) * chunk), std::ref(colors[k]));
+
+    decode(0, std::min(MAP_Y, chunk), colors[0]);
+
+    for (auto & worker : workers) worker.join();
+
+    size_t total = 0;
+    for (auto & part : colors) total += part.size();
+
+    M->colors.clear();
+    M->colors.reserve(total);
+
+    for (auto & part : colors) {
+        for (auto & [i, color] : part)
+            M->colors.insert_or_assign(i, color);
+
+        part = {};
+    }
+
+    return true;
+}
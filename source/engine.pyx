@@ -1,4 +1,7 @@
 from libcpp cimport bool as bool_t
+from libcpp.vector cimport vector
+from libc.stdint cimport uint8_t
+from libc.math cimport floor
 from cpython.ref cimport PyTypeObject
 
 from pyspades.common cimport Vector, Vertex3
@@ -34,6 +37,150 @@ cdef public class Material[object Material, type MaterialType]:
         for k, v in kw.items():
             setattr(self, k, v)
 
+# Limb flags of `BodyState`.
+VENOUS    = 1
+ARTERIAL  = 2
+FRACTURED = 4
+SPLINT    = 8
+
+cdef enum:
+    LIMBS = 6
+
+cdef class BodyState:
+    """
+    Limbs of all players, so that they are updated at once every tick. Slots are handed out by `acquire`,
+    and every slot holds `LIMBS` limbs in the order of `milsim.constants.Limb`.
+    """
+
+    cdef vector[double] hp
+    cdef vector[uint8_t] flags
+    cdef vector[int] released
+
+    # Classes of the limbs, their damage rates are looked up in `update`,
+    # so that they can be changed at runtime like any other class attribute.
+    cdef list classes
+
+    def __init__(self):
+        self.classes = []
+
+    def acquire(self, limbs):
+        """`limbs` are the classes of the limbs of the new slot."""
+        cdef int slot
+
+        assert len(limbs) == LIMBS
+
+        if self.released.empty():
+            slot = self.hp.size() // LIMBS
+            self.hp.resize(self.hp.size() + LIMBS)
+            self.flags.resize(self.flags.size() + LIMBS)
+            self.classes.extend(limbs)
+        else:
+            slot = self.released.back()
+            self.released.pop_back()
+            self.classes[slot * LIMBS:(slot + 1) * LIMBS] = limbs
+
+        self.reset(slot)
+
+        return slot
+
+    def release(self, int slot):
+        self.reset(slot)
+        self.released.push_back(slot)
+
+    cpdef reset(self, int slot):
+        for i in range(slot * LIMBS, (slot + 1) * LIMBS):
+            self.hp[i], self.flags[i] = 100, 0
+
+    cpdef reset_limb(self, int i):
+        self.hp[i], self.flags[i] = 100, 0
+
+    cpdef double get_hp(self, int i):
+        return self.hp[i]
+
+    cpdef set_hp(self, int i, double value):
+        self.hp[i] = value
+
+    cpdef bint get_flag(self, int i, int flag):
+        return self.flags[i] & flag != 0
+
+    cpdef set_flag(self, int i, int flag, bint value):
+        if value:
+            self.flags[i] |= flag
+        else:
+            self.flags[i] &= ~flag
+
+    cpdef hit(self, int i, double value):
+        if value <= 0: return
+        self.hp[i] = max(0, self.hp[i] - value)
+
+    cpdef int average(self, int slot):
+        cdef double avg = 1
+
+        for i in range(slot * LIMBS, (slot + 1) * LIMBS):
+            avg *= self.hp[i] / 100
+
+        return <int> floor(100 * avg)
+
+    cpdef bint bleeding(self, int slot):
+        for i in range(slot * LIMBS, (slot + 1) * LIMBS):
+            if self.flags[i] & (VENOUS | ARTERIAL):
+                return True
+
+        return False
+
+    cpdef bint fractured(self, int slot):
+        for i in range(slot * LIMBS, (slot + 1) * LIMBS):
+            if self.flags[i] & FRACTURED:
+                return True
+
+        return False
+
+    def wounded(self):
+        """Returns the slots that have a bleeding or fractured limb."""
+        cdef list retval = []
+
+        for i in range(self.flags.size()):
+            if self.flags[i] & (VENOUS | ARTERIAL | FRACTURED):
+                if not retval or retval[-1] != i // LIMBS:
+                    retval.append(i // LIMBS)
+
+        return retval
+
+    def update(self, entries):
+        """
+        Applies bleeding and the wear of fractured limbs, `entries` are (slot, dt, sprint, moving, airborne, firing).
+        """
+        cdef int slot, i, k
+        cdef double dt
+        cdef bint sprint, moving, airborne, firing
+        cdef uint8_t flags
+
+        for slot, dt, sprint, moving, airborne, firing in entries:
+            for k in range(LIMBS):
+                i = slot * LIMBS + k
+                flags = self.flags[i]
+
+                if not flags & (VENOUS | ARTERIAL | FRACTURED):
+                    continue
+
+                L = self.classes[i]
+
+                if flags & ARTERIAL:
+                    self.hit(i, L.arterial_rate * dt)
+
+                if flags & VENOUS:
+                    self.hit(i, L.venous_rate * dt)
+
+                if flags & FRACTURED:
+                    if not airborne:
+                        if sprint:
+                            self.hit(i, getattr(L, 'sprint_damage_rate', 0) * dt)
+                        elif moving and not flags & SPLINT:
+                            self.hit(i, getattr(L, 'walk_damage_rate', 0) * dt)
+
+                    if firing:
+                        self.hit(i, getattr(L, 'action_damage_rate', 0) * dt)
+
 cdef public MapData * mapDataRef(object o):
     assert isinstance(o, VXLData)
 
@@ -1,3 +1,6 @@
+from libcpp.vector cimport vector
+from libc.stdint cimport uint8_t, uint32_t, uint64_t
+
 from pyspades.vxl cimport VXLData, MapData, get_solid
 
 cdef extern from "VXL.hxx":
@@ -5,7 +8,117 @@ cdef extern from "VXL.hxx":
     int c_deleteQueuePop "deleteQueuePop"()
     void c_deleteQueueClear "deleteQueueClear"()
 
+    cdef struct Brush:
+        int r, g, b, jitter
+        uint64_t seed
+
+    void c_fillBox "fillBox"(MapData *, const Brush &, int, int, int, int, int, int)
+    void c_hollowBox "hollowBox"(MapData *, const Brush &, int, int, int, int, int, int)
+    void c_clearBox "clearBox"(MapData *, int, int, int, int, int, int)
+    void c_drawLine "drawLine"(MapData *, const Brush &, int, int, int, int, int, int)
+    void c_unpackMap "unpackMap"(const MapData *, uint8_t *, uint32_t *) nogil
+    void c_packMap "packMap"(MapData *, const uint8_t *, const uint32_t *) nogil
+    bint c_loadMap "loadMap"(MapData *, const uint8_t *, size_t) nogil
+
+    void c_copyRegion "copyRegion"(MapData *, const MapData *, int, int, int, int, int, int, int, int, int)
+
+cdef extern from "Milsim/Raycast.hxx":
+    void c_canSeeMany "canSeeMany"(MapData *, float, float, float, const float *, size_t, float, uint8_t *) nogil
+
+cdef Brush newBrush(tuple color, int jitter, seed):
+    cdef Brush brush
+    brush.r, brush.g, brush.b = color
+    brush.jitter = jitter
+    brush.seed = seed & 0xFFFFFFFFFFFFFFFF
+
+    return brush
+
 cdef class VxlData(VXLData):
+    # All bounds below are inclusive and clipped to the map. `jitter` shifts every colour channel of every voxel
+    # by a pseudorandom amount in [−jitter, +jitter] that depends only on `seed` and the position.
+
+    def fill_box(self, int x1, int y1, int z1, int x2, int y2, int z2, color, int jitter = 0, seed = 0):
+        if color is None:
+            c_clearBox(self.map, x1, y1, z1, x2, y2, z2)
+        else:
+            c_fillBox(self.map, newBrush(color, jitter, seed), x1, y1, z1, x2, y2, z2)
+
+    def fill_plane(self, int z, color, int x1 = 0, int y1 = 0, int x2 = 511, int y2 = 511, int jitter = 0, seed = 0):
+        self.fill_box(x1, y1, z, x2, y2, z, color, jitter, seed)
+
+    def fill_column(self, int x, int y, int z1, int z2, color, int jitter = 0, seed = 0):
+        self.fill_box(x, y, z1, x, y, z2, color, jitter, seed)
+
+    def hollow_box(self, int x1, int y1, int z1, int x2, int y2, int z2, tuple color, int jitter = 0, seed = 0):
+        c_hollowBox(self.map, newBrush(color, jitter, seed), x1, y1, z1, x2, y2, z2)
+
+    def draw_line(self, int x1, int y1, int z1, int x2, int y2, int z2, tuple color, int jitter = 0, seed = 0):
+        c_drawLine(self.map, newBrush(color, jitter, seed), x1, y1, z1, x2, y2, z2)
+
+    def copy_region(self, int x1, int y1, int z1, int x2, int y2, int z2, int x, int y, int z, VXLData source = None):
+        """Copies the box between two corners so that its first corner is placed at (x, y, z)."""
+        if source is None: source = self
+        c_copyRegion(self.map, source.map, x1, y1, z1, x2, y2, z2, x, y, z)
+
+    # Arrays have the shape (512, 512, 64) and are indexed as [x, y, z], they are stored in the Fortran order,
+    # so that their memory layout is the same as the one of `MapData`. NumPy is only required for these two.
+
+    def to_arrays(self):
+        """Returns (solid, colors) as bool and uint32 arrays, the colour is 0 where there is none."""
+        import numpy
+
+        solid  = numpy.empty(512 * 512 * 64, dtype = numpy.uint8)
+        colors = numpy.empty(512 * 512 * 64, dtype = numpy.uint32)
+
+        cdef uint8_t[::1]  S = solid
+        cdef uint32_t[::1] C = colors
+
+        with nogil:
+            c_unpackMap(self.map, &S[0], &C[0])
+
+        return (
+            solid.view(numpy.bool_).reshape((512, 512, 64), order = 'F'),
+            colors.reshape((512, 512, 64), order = 'F')
+        )
+
+    @classmethod
+    def from_arrays(cls, solid, colors):
+        """Inverse of `to_arrays`, colours of empty voxels and zero colours are not stored."""
+        import numpy
+
+        solid, colors = numpy.asarray(solid), numpy.asarray(colors)
+
+        if solid.shape != (512, 512, 64) or colors.shape != (512, 512, 64):
+            raise ValueError("expected arrays of shape (512, 512, 64)")
+
+        # This copies only when the arrays have a different dtype or memory layout.
+        S = numpy.ascontiguousarray(solid.astype(numpy.bool_, copy = False).reshape(-1, order = 'F'))
+        C = numpy.ascontiguousarray(colors.astype(numpy.uint32, copy = False).reshape(-1, order = 'F'))
+
+        cdef const uint8_t[::1]  s = S.view(numpy.uint8)
+        cdef const uint32_t[::1] c = C
+
+        cdef VxlData retval = cls()
+
+        with nogil:
+            c_packMap(retval.map, &s[0], &c[0])
+
+        return retval
+
+    @classmethod
+    def load(cls, const uint8_t[::1] data):
+        """Decodes a .vxl file from any buffer (e.g. `bytes` or `mmap`) without copying it first."""
+        cdef VxlData retval = cls()
+        cdef bint ok
+
+        with nogil:
+            ok = c_loadMap(retval.map, &data[0], data.shape[0]) if data.shape[0] > 0 else False
+
+        if not ok:
+            raise ValueError("malformed VXL data")
+
+        return retval
+
     cpdef int check_node(self, int x, int y, int z, bint destroy = False):
         return traverseNode(x, y, z, self.map, destroy)
 
@@ -41,6 +154,25 @@ def can_see(VXLData data, float x0, float y0, float z0, float x1, float y1, floa
     cdef bint retval = c_can_see(NULL, x0, y0, z0, x1, y1, z1)
     return retval
 
+def can_see_many(VXLData data, origin, positions, float radius = 128):
+    cdef float x0, y0, z0
+    x0, y0, z0 = origin
+
+    cdef vector[float] targets
+
+    for x, y, z in positions:
+        targets.push_back(x)
+        targets.push_back(y)
+        targets.push_back(z)
+
+    cdef size_t count = targets.size() // 3
+    cdef vector[uint8_t] mask = vector[uint8_t](count)
+
+    with nogil:
+        c_canSeeMany(data.map, x0, y0, z0, targets.data(), count, radius, mask.data())
+
+    return [bool(b) for b in mask]
+
 def cast_ray(VXLData data, float x0, float y0, float z0, float x1, float y1, float z1, float length):
     global global_map
     global_map = data.map